@@ -0,0 +1,84 @@
+"""
+Lokal HTTP-server, der står i stedet for billedserveren under benchmarks.
+Billederne genereres deterministisk ud fra stien i den konfigurerede størrelse
+og serveres med ETag, så revalidering også kan måles.
+"""
+import hashlib
+import http.server
+import io
+import threading
+import time
+from PIL import Image
+
+class ImageServer:
+    def __init__(self, latency=0.0, image_size=(1600, 1200), image_format="JPEG"):
+        self.latency = latency
+        self.image_size = image_size
+        self.image_format = image_format
+        self.requests = 0
+        self.bytes_sent = 0
+        self._images = {}
+        self._lock = threading.Lock()
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def render(self, path):
+        with self._lock:
+            if path not in self._images:
+                seed = int(hashlib.md5(path.encode("utf-8")).hexdigest()[:6], 16)
+                color = ((seed >> 16) & 255, (seed >> 8) & 255, seed & 255)
+                img = Image.new("RGB", self.image_size, color)
+                # Lidt struktur, så JPEG-kodningen ikke er urealistisk billig
+                for x in range(0, self.image_size[0], 64):
+                    img.paste((255 - color[0], color[1], 255 - color[2]), (x, 0, x + 8, self.image_size[1]))
+                buffer = io.BytesIO()
+                img.save(buffer, format=self.image_format, quality=90)
+                body = buffer.getvalue()
+                self._images[path] = (body, f'"{hashlib.md5(body).hexdigest()}"')
+            return self._images[path]
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                body, etag = server.render(self.path)
+                with server._lock:
+                    server.requests += 1
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", f"image/{server.image_format.lower()}")
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with server._lock:
+                    server.bytes_sent += len(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
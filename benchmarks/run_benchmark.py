@@ -0,0 +1,158 @@
+"""
+Reproducerbar offline-benchmark af PowerPoint-generatoren.
+
+Genererer syntetiske mapping-, stock- og templatefiler, serverer billeder fra en
+lokal HTTP-server og måler hvert trin i pipelinen for et antal varelister.
+Hver størrelse køres i sin egen proces med tomme caches, så tallene er kolde
+og peak RSS gælder for netop den kørsel.
+
+Eksempel:
+    python benchmarks/run_benchmark.py --items 10 100 1000 --latency 0.02 --json bench.json
+"""
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generator
+import synthetic
+from image_server import ImageServer
+
+STAGES = ["excel_load", "mapping_load_warm", "stock_read", "stock_summary", "template_load", "lookup", "slide_values",
+          "image_fetch", "slide_build", "save"]
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss er i kilobytes på Linux og i bytes på macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def pick_items(codes, count, seed=3):
+    rng = random.Random(seed)
+    items = [rng.choice(codes) for _ in range(count)]
+    # Omkring 5 % ukendte varenumre, så manglende varer også indgår
+    for index in range(0, count, 20):
+        items[index] = f"99{index:06d}"
+    return items
+
+def clear_caches():
+    generator._load_mapping.cache_clear()
+    generator._load_stock.cache_clear()
+    generator._load_template.cache_clear()
+
+def run_single(args):
+    timings = {}
+
+    def timed(stage, func, *func_args):
+        start = time.perf_counter()
+        result = func(*func_args)
+        timings[stage] = time.perf_counter() - start
+        return result
+
+    server = ImageServer(latency=args.latency, image_size=tuple(args.image_size)).start()
+    workdir = tempfile.mkdtemp(prefix="pptx-bench-")
+    os.chdir(workdir)
+    try:
+        mapping_path, stock_path, template_path, codes = synthetic.write_catalog(
+            workdir, args.catalog_rows, args.stock_rows, server.base_url)
+        items = pick_items(codes, args.single)
+
+        def load_catalog():
+            return generator.load_mapping(mapping_path), generator.load_stock(stock_path)
+
+        timed("excel_load", load_catalog)
+        clear_caches()
+        # Varm indlæsning fra snapshots; lageroversigten måles for sig, så den ikke gemmer sig i indlæsningen
+        mapping = timed("mapping_load_warm", generator.load_mapping, mapping_path)
+        stock_fingerprint = generator.file_fingerprint(stock_path)
+        stock_df = timed("stock_read", generator.read_stock_df, os.path.abspath(stock_path), stock_fingerprint)
+        summary = timed("stock_summary", generator.StockSummary, stock_df)
+        stock = generator.StockData(os.path.abspath(stock_path), stock_fingerprint, stock_df, summary)
+        template = timed("template_load", generator.load_template, template_path)
+        positions = timed("lookup", mapping.index.find_positions, items)
+        slide_values = timed("slide_values", lambda: generator.build_slide_values(items, positions, mapping, stock).slide_values)
+
+        def fetch_images():
+            prefetched = generator.prefetch_images([image_vals for _, _, image_vals in slide_values], template.image_sizes)
+            for future in prefetched.values():
+                future.result()
+            return prefetched
+
+        prefetched = timed("image_fetch", fetch_images)
+
+        def build_slides():
+            prs, template_copy, _ = generator.load_template_presentation(template.path)
+            # Uden fragment-cache, så hver kørsel måler fuld rendering
+            slide_jobs = [(values, None, False) for values in slide_values]
+            generator.render_slides(prs, template_copy, template, slide_jobs, prefetched)
+            return prs
+
+        prs = timed("slide_build", build_slides)
+        output = io.BytesIO()
+        timed("save", generator.save_presentation, prs, output)
+    finally:
+        server.stop()
+        os.chdir(os.path.dirname(workdir))
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    generation_time = sum(timings[stage] for stage in ("lookup", "slide_values", "image_fetch", "slide_build", "save"))
+    return {
+        "items": args.single,
+        "catalog_rows": args.catalog_rows,
+        "stock_rows": args.stock_rows,
+        "timings": timings,
+        "items_per_second": args.single / generation_time if generation_time else None,
+        "image_requests": server.requests,
+        "image_bytes": server.bytes_sent,
+        "pptx_bytes": len(output.getvalue()),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def print_table(results):
+    header = ["items"] + STAGES + ["items/s", "rss MB"]
+    print("  ".join(f"{col:>15}" for col in header))
+    for result in results:
+        row = [str(result["items"])]
+        row += [f"{result['timings'][stage]:.3f}s" for stage in STAGES]
+        row += [f"{result['items_per_second']:.1f}", f"{result['peak_rss_mb']:.0f}"]
+        print("  ".join(f"{col:>15}" for col in row))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline-benchmark af PowerPoint-generatoren.")
+    parser.add_argument("--items", type=int, nargs="+", default=[10, 100, 1000], help="antal varenumre pr. kørsel")
+    parser.add_argument("--catalog-rows", type=int, default=5000, help="antal rækker i den syntetiske mapping-fil")
+    parser.add_argument("--stock-rows", type=int, default=10000, help="antal rækker i den syntetiske stock-fil")
+    parser.add_argument("--latency", type=float, default=0.02, help="svartid pr. billedforespørgsel i sekunder")
+    parser.add_argument("--image-size", type=int, nargs=2, default=[1600, 1200], metavar=("W", "H"),
+                        help="størrelse på de serverede billeder i pixels")
+    parser.add_argument("--json", help="skriv resultaterne som JSON til denne fil")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.single is not None:
+        json.dump(run_single(args), sys.stdout)
+        return 0
+
+    results = []
+    for count in args.items:
+        command = [sys.executable, os.path.abspath(__file__), "--single", str(count),
+                   "--catalog-rows", str(args.catalog_rows), "--stock-rows", str(args.stock_rows),
+                   "--latency", str(args.latency), "--image-size", *map(str, args.image_size)]
+        completed = subprocess.run(command, check=True, capture_output=True, text=True)
+        results.append(json.loads(completed.stdout))
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+Syntetiske testdata til benchmarks: mapping- og stock-workbooks i valgfri størrelse
+og en template med alle placeholders fra generator-modulet.
+"""
+import random
+import pandas as pd
+from pptx import Presentation
+from pptx.util import Inches
+import generator
+
+COLORS = ["Black", "White", "Grey", "Sand", "Oak", "Dark Green", "Light Blue"]
+SIZES = ["S", "M", "L", "XL", "170 x 85 cm", "225 x 90 cm"]
+
+def product_code(index):
+    # Hver tredje vare har en variant-endelse, så bindestregs-opslaget også bliver målt
+    code = f"{10000 + index}"
+    return f"{code}-{COLORS[index % len(COLORS)][:2].upper()}" if index % 3 == 0 else code
+
+def make_mapping_df(rows, image_base_url, products=None, seed=1):
+    rng = random.Random(seed)
+    products = products or max(1, rows // 10)
+    records = []
+    for index in range(rows):
+        product = index % products
+        record = {col: "" for col in generator.REQUIRED_MAPPING_COLS_ORIG}
+        record.update({
+            "{{Product name}}": f"Product {product} - {COLORS[index % len(COLORS)]} {SIZES[index % len(SIZES)]}",
+            "{{Product code}}": product_code(index),
+            "{{Product country of origin}}": rng.choice(["Denmark", "Poland", "Vietnam", "Italy"]),
+            "{{Product height}}": f"{rng.randint(40, 200)} cm",
+            "{{Product width}}": f"{rng.randint(40, 200)} cm",
+            "{{Product length}}": f"{rng.randint(40, 300)} cm",
+            "{{Product depth}}": f"{rng.randint(20, 120)} cm",
+            "{{Product seat height}}": f"{rng.randint(40, 50)} cm" if index % 2 else None,
+            "{{Product diameter}}": None,
+            "{{CertificateName}}": "EN 16139 Level 1, EN 1728",
+            "{{Product Consumption COM}}": None,
+            "{{Product Fact Sheet link}}": f"https://example.invalid/factsheet/{product}",
+            "{{Product configurator link}}": f"https://example.invalid/configure/{product}" if index % 4 == 0 else None,
+            # Packshot pr. vare, lifestyle-billeder deles af alle varianter af produktet
+            "{{Product Packshot1}}": f"{image_base_url}/packshot/{index}.jpg",
+            "{{Product Lifestyle1}}": f"{image_base_url}/lifestyle/{product}-1.jpg",
+            "{{Product Lifestyle2}}": f"{image_base_url}/lifestyle/{product}-2.jpg",
+            "{{Product Lifestyle3}}": f"{image_base_url}/lifestyle/{product}-3.jpg",
+            "{{Product Lifestyle4}}": f"{image_base_url}/lifestyle/{product}-4.jpg",
+            "ProductKey": f"Product-{product}",
+        })
+        records.append(record)
+    return pd.DataFrame(records)
+
+def make_stock_df(rows, products, seed=2):
+    rng = random.Random(seed)
+    records = []
+    for index in range(rows):
+        rts = rng.random() < 0.2
+        records.append({
+            "productkey": f"Product-{index % products}",
+            "variantname": f"{rng.choice(COLORS)} - Variant - {rng.choice(SIZES)}",
+            "rts": 1.0 if rts else None,
+            "mto": None if rts else 1.0,
+        })
+    return pd.DataFrame(records)
+
+def make_template(path):
+    prs = Presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[6])
+    text_placeholders = list(generator.TEXT_PLACEHOLDERS_ORIG) + ["{{Product RTS}}", "{{Product MTO}}"]
+    for row, placeholder in enumerate(text_placeholders + list(generator.HYPERLINK_PLACEHOLDERS_ORIG)):
+        box = slide.shapes.add_textbox(Inches(0.3), Inches(0.2 + row * 0.45), Inches(4.5), Inches(0.4))
+        box.text_frame.text = placeholder
+    for index, placeholder in enumerate(generator.IMAGE_PLACEHOLDERS_ORIG):
+        size = 3.0 if index == 0 else 1.4
+        left = 5.2 if index == 0 else 5.2 + ((index - 1) % 2) * 1.5
+        top = 0.3 if index == 0 else 3.5 + ((index - 1) // 2) * 1.5
+        box = slide.shapes.add_textbox(Inches(left), Inches(top), Inches(size), Inches(size))
+        box.text_frame.text = placeholder
+    prs.save(path)
+
+def write_catalog(directory, mapping_rows, stock_rows, image_base_url):
+    """Skriver mapping-file.xlsx, stock.xlsx og template-generator.pptx til directory."""
+    products = max(1, mapping_rows // 10)
+    mapping_df = make_mapping_df(mapping_rows, image_base_url, products)
+    stock_df = make_stock_df(stock_rows, products)
+    mapping_path = f"{directory}/mapping-file.xlsx"
+    stock_path = f"{directory}/stock.xlsx"
+    template_path = f"{directory}/template-generator.pptx"
+    mapping_df.to_excel(mapping_path, index=False)
+    stock_df.to_excel(stock_path, index=False)
+    make_template(template_path)
+    return mapping_path, stock_path, template_path, mapping_df["{{Product code}}"].tolist()
@@ -0,0 +1,61 @@
+"""
+Kommandolinje til PowerPoint-generering uden Streamlit.
+
+Eksempel:
+    python cli.py varenumre.txt -o generated_presentation.pptx
+"""
+import argparse
+import sys
+import generator
+from instrumentation import Metrics
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generér en PowerPoint med én slide pr. varenummer.")
+    parser.add_argument("items_file", help="fil med ét varenummer pr. linje ('-' læser fra stdin)")
+    parser.add_argument("-o", "--output", default="generated_presentation.pptx",
+                        help="output-fil (.pptx, eller .zip sammen med --part-size)")
+    parser.add_argument("--mapping", default=generator.MAPPING_FILE_PATH, help="sti til mapping-fil")
+    parser.add_argument("--stock", default=generator.STOCK_FILE_PATH, help="sti til stock-fil")
+    parser.add_argument("--template", default=generator.TEMPLATE_FILE_PATH, help="sti til PowerPoint-template")
+    parser.add_argument("--parallel", action="store_true", help="render slides i flere processer")
+    parser.add_argument("--part-size", type=int, help="opdel i delfiler med dette antal varer og skriv et zip-arkiv")
+    parser.add_argument("--compress-level", type=int, choices=range(10), metavar="0-9",
+                        help=f"komprimering af XML-delene (standard {generator.XML_COMPRESS_LEVEL})")
+    parser.add_argument("--metrics-json", help="gem ydelsesrapporten som JSON i denne fil")
+    args = parser.parse_args(argv)
+
+    item_numbers = generator.read_item_numbers(args.items_file)
+    if not item_numbers:
+        print("Ingen gyldige varenumre fundet.", file=sys.stderr)
+        return 1
+    metrics = Metrics()
+    try:
+        with metrics.stage("load_mapping"):
+            mapping = generator.load_mapping(args.mapping)
+        with metrics.stage("load_stock"):
+            stock = generator.load_stock(args.stock)
+        with metrics.stage("load_template"):
+            template = generator.load_template(args.template)
+    except Exception as e:
+        print(f"Fejl ved indlæsning af data: {e}", file=sys.stderr)
+        return 1
+
+    def on_progress(fraction, message):
+        print(f"[{fraction:4.0%}] {message}", file=sys.stderr)
+
+    result = generator.generate_deck(item_numbers, mapping, stock, template, output=args.output,
+                                     part_size=args.part_size, parallel=args.parallel, progress=on_progress,
+                                     metrics=metrics, compress_level=args.compress_level)
+    for warning in result.warnings:
+        print(f"Advarsel: {warning}", file=sys.stderr)
+    if result.missing_items:
+        print("Manglende varenumre:", file=sys.stderr)
+        for item_no in result.missing_items:
+            print(item_no, file=sys.stderr)
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json, result.metrics)
+    print(result.output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
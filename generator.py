@@ -0,0 +1,1926 @@
+"""
+PowerPoint-generering uden Streamlit.
+
+Modulet indeholder hele pipelinen – indlæsning af mapping-, stock- og templatefiler,
+opslag, lagertekster, billedhentning og opbygning af slides – så den kan bruges
+fra Streamlit-appen, fra kommandolinjen (cli.py) og fra batchjob. De indlæste
+dataobjekter kan genbruges på tværs af kald.
+"""
+import pandas as pd
+from pptx import Presentation
+import io
+import re
+import requests
+import requests.adapters
+from PIL import Image
+from copy import deepcopy
+import math
+import bisect
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+import collections
+import contextlib
+import functools
+import itertools
+import logging
+import shutil
+import sys
+import tempfile
+import zipfile
+from instrumentation import Metrics
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from lxml import etree
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import qn
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from pptx.opc.oxml import serialize_part_xml
+# save_presentation og MediaRegistry bruger python-pptx' interne API (_ContentTypesItem,
+# _rels og _add_pic_from_image_part); requirements.txt låser derfor python-pptx til 1.0.x
+from pptx.opc.serialized import _ContentTypesItem
+from pptx.opc.packuri import PackURI
+from pptx.parts.image import Image as PptxImage, ImagePart
+
+# Filstier – tilpas efter behov
+MAPPING_FILE_PATH = "mapping-file.xlsx"
+STOCK_FILE_PATH = "stock.xlsx"
+TEMPLATE_FILE_PATH = "template-generator.pptx"
+# Binære kolonne-snapshots af Excel-filerne (Parquet), så de kun parses ved ændringer
+SNAPSHOT_DIR = os.path.join(".cache", "snapshots")
+# Øges, når snapshot-formatet ændres, så gamle snapshots ikke genbruges
+SNAPSHOT_FORMAT = 2
+# Maksimalt antal samtidige billeddownloads for hele processen
+IMAGE_FETCH_CONCURRENCY = int(os.environ.get("IMAGE_FETCH_CONCURRENCY", "8"))
+# Diskcache til færdigbehandlede billeder: pladsbudget og alder før revalidering
+IMAGE_CACHE_DIR = os.path.join(".cache", "images")
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+IMAGE_CACHE_MAX_AGE = int(os.environ.get("IMAGE_CACHE_MAX_AGE", str(24 * 60 * 60)))
+# Billeder skaleres til placeholder-formens størrelse ved denne opløsning og kodes én gang
+IMAGE_TARGET_DPI = int(os.environ.get("IMAGE_TARGET_DPI", "150"))
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", "70"))
+EMU_PER_INCH = 914400
+# Antal processer til afkodning, nedskalering og kodning af billeder (0 = i hentetrådene,
+# som er standard på maskiner med én kerne, hvor en processpulje kun giver overhead)
+IMAGE_PROCESSES = int(os.environ.get("IMAGE_PROCESSES", str(os.cpu_count() if (os.cpu_count() or 1) > 1 else 0)))
+# Antal workerprocesser ved parallel rendering af slides
+RENDER_PROCESSES = int(os.environ.get("RENDER_PROCESSES", str(os.cpu_count() or 1)))
+# Slides sendes til workerne i bidder af denne størrelse
+RENDER_CHUNK_SIZE = 8
+# Fremdrift rapporteres for hver batch af denne størrelse
+PROGRESS_BATCH_SIZE = 10
+# Opdelt output: delfiler og zip-arkiver gemmes her og ryddes op efter OUTPUT_MAX_AGE sekunder
+OUTPUT_DIR = os.path.join(".cache", "output")
+OUTPUT_MAX_AGE = 24 * 60 * 60
+DEFAULT_PART_SIZE = int(os.environ.get("DEFAULT_PART_SIZE", "200"))
+# Komprimeringsniveau (0-9) for XML-delene, når præsentationer gemmes
+XML_COMPRESS_LEVEL = int(os.environ.get("XML_COMPRESS_LEVEL", "6"))
+# Allerede komprimerede mediedele, der gemmes ukomprimeret i .pptx-filen
+PRECOMPRESSED_CONTENT_TYPES = {"image/jpeg", "image/png", "image/gif"}
+# Opvarmning ved serverstart: indlæs data og hent billeder til populære varer i baggrunden
+WARMUP_ENABLED = os.environ.get("WARMUP", "1") != "0"
+WARMUP_ITEMS_FILE = os.environ.get("WARMUP_ITEMS_FILE", "popular_items.txt")
+# Antal generationer, der må bygge slides samtidig på tværs af sessioner
+MAX_CONCURRENT_JOBS = int(os.environ.get("MAX_CONCURRENT_JOBS", "2"))
+# Hvor ofte (sekunder) mapping- og stock-filen tjekkes for ændringer; 0 slår overvågningen fra
+CATALOG_POLL_INTERVAL = float(os.environ.get("CATALOG_POLL_INTERVAL", "30"))
+# Cache med færdigrenderede slides (XML) pr. vare til hurtig regenerering
+FRAGMENT_CACHE_MAX_BYTES = int(os.environ.get("FRAGMENT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+logger = logging.getLogger(__name__)
+
+def stage(metrics, name):
+    """Tidtager et trin, hvis der måles; ellers en tom kontekst."""
+    return metrics.stage(name) if metrics else contextlib.nullcontext()
+
+# --- Forventede kolonner i mapping-fil ---
+REQUIRED_MAPPING_COLS_ORIG = [
+    "{{Product name}}",
+    "{{Product code}}",
+    "{{Product country of origin}}",
+    "{{Product height}}",
+    "{{Product width}}",
+    "{{Product length}}",
+    "{{Product depth}}",
+    "{{Product seat height}}",
+    "{{Product diameter}}",
+    "{{CertificateName}}",
+    "{{Product Consumption COM}}",
+    "{{Product Fact Sheet link}}",
+    "{{Product configurator link}}",
+    "{{Product Packshot1}}",
+    "{{Product Lifestyle1}}",
+    "{{Product Lifestyle2}}",
+    "{{Product Lifestyle3}}",
+    "{{Product Lifestyle4}}",
+    "ProductKey"
+]
+
+# --- Forventede kolonner i stock-fil ---
+REQUIRED_STOCK_COLS_ORIG = [
+    "productkey",
+    "variantname",
+    "rts",
+    "mto"
+]
+
+# --- Placeholders til erstatning i templaten ---
+TEXT_PLACEHOLDERS_ORIG = {
+    "{{Product name}}": "Product Name:",
+    "{{Product code}}": "Product Code:",
+    "{{Product country of origin}}": "Country of origin:",
+    "{{Product height}}": "Height:",
+    "{{Product width}}": "Width:",
+    "{{Product length}}": "Length:",
+    "{{Product depth}}": "Depth:",
+    "{{Product seat height}}": "Seat Height:",
+    "{{Product diameter}}": "Diameter:",
+    "{{CertificateName}}": "Test & certificates for the product:",
+    "{{Product Consumption COM}}": "Consumption information for COM:"
+}
+
+HYPERLINK_PLACEHOLDERS_ORIG = {
+    "{{Product Fact Sheet link}}": "Download Product Fact Sheet",
+    "{{Product configurator link}}": "Click to configure product"
+}
+
+IMAGE_PLACEHOLDERS_ORIG = [
+    "{{Product Packshot1}}",
+    "{{Product Lifestyle1}}",
+    "{{Product Lifestyle2}}",
+    "{{Product Lifestyle3}}",
+    "{{Product Lifestyle4}}",
+]
+
+# --- Almindelig gruppering af variantnavne (simpel version) ---
+def group_by_color_and_size(variant_names):
+    """
+    Denne funktion grupperer variantnavnene efter farve og samler unikke størrelser.
+    For hvert variantnavn forventes formatet: "Farve - [noget] - Størrelse".
+    Den bruger den første del som farve og den sidste som størrelse.
+    Output: "Farve: Størrelse 1, Størrelse 2, ..."
+    Hvis der ikke findes en " - " separator, returneres navnet uændret.
+    """
+    groups = {}
+    for name in variant_names:
+        if " - " in name:
+            parts = name.split(" - ")
+            color = parts[0].strip()
+            size = parts[-1].strip()  # den sidste del
+        else:
+            color = name.strip()
+            size = ""
+        groups.setdefault(color, set())
+        if size:
+            groups[color].add(size)
+    output_lines = []
+    for color, sizes in groups.items():
+        if sizes:
+            output_lines.append(f"{color}: {', '.join(sorted(sizes))}")
+        else:
+            output_lines.append(color)
+    return "\n".join(sorted(output_lines))
+
+# --- Alternativ logik via en fast defineret produktkonfigurator ---
+class ProductConfigurator:
+    def __init__(self):
+        # Faste produktkombinationer: (overflade, mellemstykke, ben) -> benfarver
+        self.products = {
+            ("Black Linoleum", "Plywood", "Plywood"): ["Black", "Grey", "Sand", "White"],
+            ("Grey Linoleum", "Plywood", "Plywood"): ["Black", "Grey", "Sand", "White"],
+            ("Oak Lacquered Oak Veneer", "Plywood", "Plywood"): ["Black", "Grey", "Sand", "White"],
+            ("Oak Oiled Oak", "Oak Oiled Oak", "Oak Oiled Oak"): ["Black", "Grey", "Sand", "White"],
+            ("Sand Laminate", "Plywood", "Plywood"): ["Black", "Grey", "Sand", "White"],
+            ("Smoked Oak Oiled Oak", "Smoked Oak Oiled Oak", "Smoked Oak Oiled Oak"): ["Black", "Grey", "Sand", "White"],
+            ("White Laminate", "Plywood", "Plywood"): ["Black", "Grey", "Sand", "White"],
+        }
+        # Standardstørrelser
+        self.default_sizes = [
+            "170 x 85 cm / 67 x 33.5\"",
+            "225 x 90 cm / 88.5 x 35.5\"",
+            "255 x 108 cm / 100.5 x 42.5\"",
+            "295 x 108 cm / 116 x 42.5\"",
+        ]
+        # Specifikke størrelser for enkelte overflader
+        self.specific_sizes = {
+            "Sand Laminate": [
+                "225 x 90 cm / 88.5 x 35.5\"",
+                "255 x 108 cm / 100.5 x 42.5\"",
+                "295 x 108 cm / 116 x 42.5\"",
+            ]
+        }
+    
+    def get_options(self, product_name):
+        """Hvis produktnavnet indeholder et af overfladenavnene, returnér de fast definerede benfarver og størrelser."""
+        for (surface, core, legs), colors in self.products.items():
+            if surface.lower() in product_name.lower():
+                sizes = self.specific_sizes.get(surface, self.default_sizes)
+                return {"benfarver": colors, "størrelser": sizes}
+        return None
+
+configurator = ProductConfigurator()
+
+# --- Almindelige hjælpefunktioner ---
+def normalize_text(s):
+    return re.sub(r"\s+", "", str(s).replace("\u00A0", " ")).lower()
+
+def normalize_col(col):
+    return normalize_text(col)
+
+def normalize_series(values):
+    """Vektoriseret udgave af normalize_text for en hel pandas-kolonne."""
+    # Via object-array, så manglende værdier bliver "nan" ligesom str(værdi) i stedet for at forblive NaN
+    text = pd.Series(values.to_numpy(dtype=object).astype(str), index=values.index, dtype=object)
+    return (text
+            .str.replace("\u00A0", " ", regex=False)
+            .str.replace(r"\s+", "", regex=True)
+            .str.lower())
+
+def read_item_numbers(path):
+    """
+    Læser varenumre fra en fil med ét pr. linje ('-' læser fra stdin); tomme linjer
+    og linjer med # springes over.
+    """
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, encoding="utf-8") as item_file:
+            lines = item_file.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+
+# --- Cachede kolonne-snapshots af Excel-filerne ---
+_fingerprint_memo = {}
+
+def file_fingerprint(path):
+    """
+    Returnerer et fingeraftryk for filen ud fra størrelse og indholdshash.
+    Hashen genberegnes kun, når størrelse eller mtime ændrer sig.
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    fingerprint = _fingerprint_memo.get(memo_key)
+    if fingerprint is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        fingerprint = f"{stat.st_size}-{digest.hexdigest()[:32]}"
+        _fingerprint_memo[memo_key] = fingerprint
+    return fingerprint
+
+def compact_dtypes(df):
+    """
+    Tekstkolonner gemmes som strenge (eller kategorier ved mange gentagelser).
+    Tal beholdes som float64, da de vises på slides – float32 ville fx gøre 45.3 til 45.29999923706055.
+    """
+    for col in df.columns:
+        values = df[col]
+        if not pd.api.types.is_numeric_dtype(values):
+            values = values.astype(str).where(values.notna(), None)
+            if values.nunique() < len(values) // 2:
+                values = values.astype("category")
+            df[col] = values
+    return df
+
+def read_excel_snapshot(path, fingerprint, required_cols):
+    """
+    Læser en Excel-fil med normaliserede kolonnenavne og kun de nødvendige kolonner.
+    Resultatet gemmes som Parquet i SNAPSHOT_DIR under filens fingeraftryk, så
+    senere kørsler og andre processer kan springe openpyxl-parsingen over.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    snapshot_path = os.path.join(SNAPSHOT_DIR, f"{stem}-{fingerprint}-v{SNAPSHOT_FORMAT}.parquet")
+    if os.path.exists(snapshot_path):
+        try:
+            return pd.read_parquet(snapshot_path)
+        except Exception:
+            pass  # Ødelagt snapshot – læs Excel-filen igen
+    df = pd.read_excel(path)
+    df.columns = [normalize_col(col) for col in df.columns]
+    df = compact_dtypes(df[[col for col in required_cols if col in df.columns]].copy())
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, snapshot_path)
+    except Exception:
+        pass  # Snapshot er kun en optimering; fortsæt uden
+    else:
+        remove_old_snapshots(stem, snapshot_path)
+    return df
+
+def remove_old_snapshots(stem, keep_path):
+    """Sletter snapshots af tidligere versioner af samme fil, så SNAPSHOT_DIR ikke vokser ved hver ændring."""
+    pattern = re.compile(re.escape(stem) + r"-\d+-[0-9a-f]{32}-v\d+\.parquet")
+    for name in os.listdir(SNAPSHOT_DIR):
+        path = os.path.join(SNAPSHOT_DIR, name)
+        if pattern.fullmatch(name) and path != keep_path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Fx i brug af en anden proces; ryddes næste gang
+
+# --- Opslagsindeks over mapping-filens varenumre ---
+class MappingIndex:
+    """
+    Bygges én gang pr. indlæst mapping-fil. Normaliserede varenumre gemmes i en
+    ordbog til præcise opslag og i et sorteret array til præfiks-opslag med bisect.
+    For begge gælder, at den første række i filen vinder – ligesom ved en lineær scanning.
+    """
+    def __init__(self, mapping_df, mapping_prod_key, codes=None):
+        self.mapping_df = mapping_df
+        if codes is None:
+            if mapping_prod_key in mapping_df.columns:
+                codes = normalize_series(mapping_df[mapping_prod_key]).tolist()
+            else:
+                codes = [normalize_text("")] * len(mapping_df)
+        # De normaliserede varenumre i filens rækkefølge, til with_changes
+        self.codes = pd.Series(codes, dtype=object)
+        self.exact = {}
+        for pos, code in enumerate(codes):
+            self.exact.setdefault(code, pos)
+        # Unikke koder i sorteret rækkefølge med positionen for deres første forekomst
+        self.sorted_codes = sorted(self.exact)
+        self.sorted_positions = [self.exact[code] for code in self.sorted_codes]
+        self._prefix_cache = {}
+
+    def with_changes(self, mapping_df, codes, changed_codes):
+        """
+        Indeks for en ny version af filen, hvor kun changed_codes (tilføjede, ændrede
+        og fjernede varenumre) opdateres i ordbogen og det sorterede array. Er rækker
+        med andre varenumre flyttet, passer positionerne ikke, og indekset bygges forfra.
+        """
+        codes = pd.Series(codes, dtype=object)
+        if len(codes) != len(self.codes):
+            return MappingIndex(mapping_df, None, codes.tolist())
+        moved = self.codes.to_numpy() != codes.to_numpy()
+        if not (self.codes[moved].isin(changed_codes).all() and codes[moved].isin(changed_codes).all()):
+            return MappingIndex(mapping_df, None, codes.tolist())
+
+        index = object.__new__(MappingIndex)
+        index.mapping_df = mapping_df
+        index.codes = codes
+        index.exact = dict(self.exact)
+        index.sorted_codes = list(self.sorted_codes)
+        index.sorted_positions = list(self.sorted_positions)
+        index._prefix_cache = {}
+        for code in changed_codes:
+            index.exact.pop(code, None)
+        affected = codes[codes.isin(changed_codes)].drop_duplicates()
+        for position, code in zip(affected.index.tolist(), affected.tolist()):
+            index.exact[code] = position
+        for code in changed_codes:
+            i = bisect.bisect_left(index.sorted_codes, code)
+            present = i < len(index.sorted_codes) and index.sorted_codes[i] == code
+            if code in index.exact:
+                if present:
+                    index.sorted_positions[i] = index.exact[code]
+                else:
+                    index.sorted_codes.insert(i, code)
+                    index.sorted_positions.insert(i, index.exact[code])
+            elif present:
+                del index.sorted_codes[i]
+                del index.sorted_positions[i]
+        return index
+
+    def _find_prefix_position(self, prefix):
+        if prefix in self._prefix_cache:
+            return self._prefix_cache[prefix]
+        start = bisect.bisect_left(self.sorted_codes, prefix)
+        end = bisect.bisect_left(self.sorted_codes, prefix + "\U0010FFFF")
+        position = min(self.sorted_positions[start:end], default=None)
+        self._prefix_cache[prefix] = position
+        return position
+
+    def find_position(self, item_no):
+        norm_item = normalize_text(item_no)
+        position = self.exact.get(norm_item)
+        if position is None and "-" in str(item_no):
+            partial = normalize_text(str(item_no).split("-")[0])
+            position = self._find_prefix_position(partial)
+        return position
+
+    def find_positions(self, item_numbers):
+        """
+        Slår en hel liste af varenumre op på én gang og returnerer rækkepositioner
+        (None for manglende varer). Præcise match findes vektoriseret; kun varenumre
+        med bindestreg, der ikke matcher præcist, falder tilbage til præfiks-opslag.
+        """
+        items = pd.Series([str(item_no) for item_no in item_numbers], dtype=object)
+        exact = normalize_series(items).map(self.exact)
+        fallback = exact.isna() & items.str.contains("-", regex=False)
+        positions = [None if pd.isna(position) else int(position) for position in exact.tolist()]
+        if fallback.any():
+            prefixes = normalize_series(items[fallback].str.split("-").str[0])
+            for i, prefix in zip(prefixes.index, prefixes.tolist()):
+                positions[i] = self._find_prefix_position(prefix)
+        return positions
+
+    def find_rows(self, item_numbers):
+        """Slår en hel liste af varenumre op på én gang. Manglende varer giver None."""
+        return [None if position is None else self.mapping_df.iloc[position]
+                for position in self.find_positions(item_numbers)]
+
+def find_mapping_row(item_no, mapping_df, mapping_prod_key, index=None):
+    if index is None:
+        index = MappingIndex(mapping_df, mapping_prod_key)
+    return index.find_rows([item_no])[0]
+
+# --- Forberegnet lageroversigt pr. produktnøgle ---
+class StockSummary:
+    """
+    Normaliserer stock-filens produktnøgler én gang og grupperer rækkerne pr. nøgle.
+    For hver nøgle gemmes de grupperede RTS- og MTO-tekster, så arbejdet pr. slide
+    blot er et ordbogsopslag. Konfigurator-teksten afhænger af produktnavnet og
+    gemmes derfor pr. navn.
+    """
+    def __init__(self, stock_df, previous=None, changed_keys=None):
+        if previous is None or changed_keys is None:
+            self.rts_texts = self._summarize(stock_df, "rts")
+            self.mto_texts = self._summarize(stock_df, "mto")
+            self._configurator_texts = {}
+            return
+        # Kun de ændrede nøgler beregnes igen; resten kopieres fra den forrige oversigt
+        self.rts_texts = {key: text for key, text in previous.rts_texts.items() if key not in changed_keys}
+        self.rts_texts.update(self._summarize(stock_df, "rts", changed_keys))
+        self.mto_texts = {key: text for key, text in previous.mto_texts.items() if key not in changed_keys}
+        self.mto_texts.update(self._summarize(stock_df, "mto", changed_keys))
+        self._configurator_texts = dict(previous._configurator_texts)
+
+    @staticmethod
+    def _summarize(stock_df, flag_col, only_keys=None):
+        try:
+            flagged = stock_df[stock_df[flag_col].notna() & (stock_df[flag_col] != "")]
+            keys = normalize_series(flagged["productkey"])
+            if only_keys is not None:
+                selected = keys.isin(only_keys)
+                flagged = flagged[selected]
+                keys = keys[selected]
+            variants = flagged["variantname"]
+        except KeyError as e:
+            logger.error(f"KeyError i {flag_col.upper()}: {e}")
+            return {}
+        variants = variants[variants.notna()].astype(str)
+        texts = {}
+        for key, names in variants.groupby(keys[variants.index], sort=False):
+            unique_variant_names = list(dict.fromkeys(names.tolist()))
+            texts[key] = group_by_color_and_size(unique_variant_names)
+        # Nøgler uden variantnavne har stadig lager og kan få konfigurator-teksten
+        for key in keys.unique():
+            texts.setdefault(key, "")
+        return texts
+
+    def configurator_text(self, product_name):
+        if product_name not in self._configurator_texts:
+            options = configurator.get_options(product_name)
+            if options:
+                text = f"Benfarver: {', '.join(options['benfarver'])}\nStørrelser: {', '.join(options['størrelser'])}"
+            else:
+                text = None
+            self._configurator_texts[product_name] = text
+        return self._configurator_texts[product_name]
+
+    def _lookup(self, texts, product_key, product_name):
+        if not product_key or pd.isna(product_key):
+            return ""
+        text = texts.get(normalize_text(product_key))
+        if text is None:
+            return ""
+        # Tjek, om produktnavnet matcher en af de konfigurationer
+        override = self.configurator_text(str(product_name))
+        return override if override is not None else text
+
+    def texts_for(self, product_key, product_name):
+        """Returnerer (RTS-tekst, MTO-tekst) for en produktnøgle og et produktnavn fra mapping-filen."""
+        return (self._lookup(self.rts_texts, product_key, product_name),
+                self._lookup(self.mto_texts, product_key, product_name))
+
+    def rts_text(self, mapping_row):
+        return self._lookup(self.rts_texts, mapping_row.get("productkey", ""),
+                            mapping_row.get(normalize_col("{{Product name}}"), ""))
+
+    def mto_text(self, mapping_row):
+        return self._lookup(self.mto_texts, mapping_row.get("productkey", ""),
+                            mapping_row.get(normalize_col("{{Product name}}"), ""))
+
+def process_stock_rts_alternative(mapping_row, stock_df, summary=None):
+    if summary is None:
+        summary = StockSummary(stock_df)
+    return summary.rts_text(mapping_row)
+
+def process_stock_mto_alternative(mapping_row, stock_df, summary=None):
+    if summary is None:
+        summary = StockSummary(stock_df)
+    return summary.mto_text(mapping_row)
+
+@functools.lru_cache(maxsize=None)
+def get_http_session():
+    """Fælles HTTP-session med keep-alive forbindelser til billedserveren."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=IMAGE_FETCH_CONCURRENCY,
+                                            pool_maxsize=IMAGE_FETCH_CONCURRENCY)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@functools.lru_cache(maxsize=None)
+def get_image_executor():
+    """Processens fælles trådpulje til billedhentning – begrænser samtidige downloads globalt."""
+    return ThreadPoolExecutor(max_workers=IMAGE_FETCH_CONCURRENCY, thread_name_prefix="image-fetch")
+
+def process_image(content, quality=70, max_size=(1200, 1200)):
+    """
+    Afkoder, nedskalerer og JPEG-koder et billede i ét gennemløb.
+    Store JPEG-kilder afkodes i draft-tilstand direkte i en reduceret opløsning.
+    """
+    img = Image.open(io.BytesIO(content))
+    if img.format == "JPEG":
+        img.draft("RGB", max_size)
+    if img.mode not in ("RGB", "L", "CMYK") or (img.format and img.format.lower() == "tiff"):
+        img = img.convert("RGB")
+    img.thumbnail(max_size, Image.LANCZOS)
+    img_byte_arr = io.BytesIO()
+    img.save(img_byte_arr, format="JPEG", quality=quality, optimize=True)
+    return img_byte_arr.getvalue()
+
+@functools.lru_cache(maxsize=None)
+def get_image_process_pool():
+    """
+    Processens fælles processpulje til billedbehandling. Hentningen bliver på
+    I/O-trådene, mens det CPU-tunge arbejde kører uden for GIL'en.
+    """
+    return ProcessPoolExecutor(max_workers=IMAGE_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+
+def transcode_image(content, quality=70, max_size=(1200, 1200)):
+    """
+    Kører process_image i processpuljen. Kun de rå bytes sendes til workeren og
+    kun den færdige JPEG sendes tilbage. Går puljen i stykker, behandles billedet
+    i den kaldende tråd, og en ny pulje oprettes ved næste kald.
+    """
+    if IMAGE_PROCESSES < 1:
+        return process_image(content, quality, max_size)
+    try:
+        return get_image_process_pool().submit(process_image, content, quality, max_size).result()
+    except BrokenProcessPool:
+        logger.warning("Billedpuljen er stoppet uventet og startes igen")
+        get_image_process_pool.cache_clear()
+        return process_image(content, quality, max_size)
+
+# --- Diskbaseret billedcache ---
+class ImageCache:
+    """
+    Gemmer færdigbehandlede JPEG-billeder på disk, adresseret efter indholdets SHA-256.
+    Et SQLite-indeks knytter (URL, kvalitet, størrelse) til et objekt og husker ETag,
+    Last-Modified og seneste brug. Indgange ældre end max_age revalideres med en
+    betinget GET, og fejler hentningen, serveres den gemte kopi. Når cachen
+    overstiger max_bytes, fjernes de mindst nyligt brugte objekter.
+    """
+    def __init__(self, directory, max_bytes, max_age):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        self.index_path = os.path.join(directory, "index.sqlite3")
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY, url TEXT, digest TEXT, size INTEGER,
+                    etag TEXT, last_modified TEXT, fetched_at REAL, accessed_at REAL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(url, quality, max_size):
+        return hashlib.sha256(f"{url}|{quality}|{tuple(max_size)}".encode("utf-8")).hexdigest()
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, "objects", digest[:2], f"{digest}.jpg")
+
+    def _read_object(self, digest):
+        try:
+            with open(self._object_path(digest), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_object(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def get(self, url, quality=70, max_size=(1200, 1200), session=None, metrics=None):
+        key = self.make_key(url, quality, max_size)
+        with self._connect() as conn:
+            entry = conn.execute(
+                "SELECT digest, etag, last_modified, fetched_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        cached = self._read_object(entry[0]) if entry else None
+        now = time.time()
+        if cached is not None and now - entry[3] < self.max_age:
+            self._touch(key, now)
+            if metrics:
+                metrics.incr("image_cache_hit")
+            return cached
+
+        headers = {}
+        if cached is not None:
+            if entry[1]:
+                headers["If-None-Match"] = entry[1]
+            if entry[2]:
+                headers["If-Modified-Since"] = entry[2]
+        request_start = time.perf_counter()
+        try:
+            response = (session or requests).get(url, timeout=30, headers=headers)
+        except Exception:
+            if cached is not None:
+                if metrics:
+                    metrics.incr("image_cache_stale")
+                return cached  # Serveres fra den gemte kopi, når billedserveren ikke svarer
+            if metrics:
+                metrics.incr("image_fetch_error")
+            raise
+        if metrics:
+            metrics.record_fetch(url, time.perf_counter() - request_start,
+                                 len(response.content) if response.status_code == 200 else 0)
+        if response.status_code == 304 and cached is not None:
+            with self._connect() as conn:
+                conn.execute("UPDATE entries SET fetched_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+            if metrics:
+                metrics.incr("image_cache_revalidated")
+            return cached
+        if response.status_code != 200:
+            if metrics:
+                metrics.incr("image_cache_stale" if cached is not None else "image_fetch_error")
+            return cached
+
+        if metrics:
+            metrics.incr("image_cache_miss")
+        with stage(metrics, "image_process"):
+            data = transcode_image(response.content, quality, max_size)
+        digest = self._write_object(data)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, digest, len(data), response.headers.get("ETag"),
+                 response.headers.get("Last-Modified"), now, now))
+            self._evict(conn)
+        return data
+
+    def _touch(self, key, now):
+        with self._connect() as conn:
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+
+    def _evict(self, conn):
+        objects = conn.execute(
+            "SELECT digest, MAX(size), MAX(accessed_at) FROM entries GROUP BY digest ORDER BY MAX(accessed_at)"
+        ).fetchall()
+        total = sum(size for _, size, _ in objects)
+        for digest, size, _ in objects:
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM entries WHERE digest = ?", (digest,))
+            try:
+                os.remove(self._object_path(digest))
+            except OSError:
+                pass
+            total -= size
+
+@functools.lru_cache(maxsize=None)
+def get_image_cache():
+    return ImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_MAX_AGE)
+
+def fetch_and_process_image_cached(url, quality=70, max_size=(1200, 1200), session=None, metrics=None):
+    return get_image_cache().get(url, quality, max_size, session, metrics)
+
+# --- Fælles jobplanlægning på tværs af sessioner ---
+class GenerationCancelled(Exception):
+    """Genereringen blev afbrudt, fordi sessionen startede en ny kørsel."""
+
+class FetchTask:
+    def __init__(self, key, session_id, metrics):
+        self.key = key
+        self.session_id = session_id
+        self.metrics = metrics
+        self.future = concurrent.futures.Future()
+        self.owners = set()
+        self.started = False
+
+class Job:
+    """Én generering i én session. Annulleres, når sessionen starter en ny, eller når den afsluttes."""
+    def __init__(self, scheduler, session_id):
+        self.scheduler = scheduler
+        self.session_id = session_id
+        self.cancelled = threading.Event()
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise GenerationCancelled("Genereringen blev afbrudt af en ny kørsel.")
+
+    def fetch(self, url, quality, max_size, metrics=None):
+        return self.scheduler.submit_fetch(self, url, quality, max_size, metrics)
+
+class JobScheduler:
+    """
+    Processens fælles planlægger for genereringer. Et fast antal hentetråde
+    betjener sessionernes køer på skift, så én stor vareliste ikke sulter de
+    andre. Samme billede, der allerede er i kø eller under hentning, deles mellem
+    sessionerne. Højst max_jobs genereringer bygger slides ad gangen; resten venter
+    på en ledig plads, mens deres billeder hentes.
+    """
+    def __init__(self, fetch_workers, max_jobs):
+        self._cond = threading.Condition()
+        self._queues = collections.OrderedDict()
+        self._inflight = {}
+        self._jobs = {}
+        self._job_slots = threading.Semaphore(max_jobs)
+        for worker_index in range(fetch_workers):
+            threading.Thread(target=self._fetch_worker, name=f"image-fetch-{worker_index}", daemon=True).start()
+
+    def start_job(self, session_id):
+        """Opretter et nyt job for sessionen og annullerer sessionens tidligere job."""
+        job = Job(self, session_id)
+        with self._cond:
+            previous = self._jobs.get(session_id)
+            self._jobs[session_id] = job
+        if previous is not None:
+            self.cancel(previous)
+        return job
+
+    def finish_job(self, job):
+        """Frigiver jobbets billeder i kø; hentninger, som andre sessioner venter på, fortsætter."""
+        self.cancel(job)
+        with self._cond:
+            if self._jobs.get(job.session_id) is job:
+                del self._jobs[job.session_id]
+
+    def cancel(self, job):
+        job.cancelled.set()
+        with self._cond:
+            for key, task in list(self._inflight.items()):
+                task.owners.discard(job)
+                if not task.owners and not task.started:
+                    task.future.cancel()
+                    del self._inflight[key]
+
+    def submit_fetch(self, job, url, quality, max_size, metrics=None):
+        key = (url, quality, max_size)
+        with self._cond:
+            task = self._inflight.get(key)
+            if task is None:
+                task = FetchTask(key, job.session_id, metrics)
+                self._inflight[key] = task
+                self._queues.setdefault(job.session_id, collections.deque()).append(task)
+                self._cond.notify()
+            elif metrics:
+                metrics.incr("image_fetch_shared")
+            task.owners.add(job)
+            return task.future
+
+    def _next_task(self):
+        # Sessionerne betjenes på skift: den betjente session flyttes bagerst
+        while True:
+            for session_id, queue in list(self._queues.items()):
+                while queue:
+                    task = queue.popleft()
+                    if not task.started and not task.future.cancelled():
+                        break
+                else:
+                    del self._queues[session_id]
+                    continue
+                self._queues.move_to_end(session_id)
+                if not queue:
+                    del self._queues[session_id]
+                task.started = True
+                return task
+            self._cond.wait()
+
+    def _fetch_worker(self):
+        while True:
+            with self._cond:
+                task = self._next_task()
+            if task.future.set_running_or_notify_cancel():
+                url, quality, max_size = task.key
+                try:
+                    task.future.set_result(fetch_and_process_image_cached(url, quality, max_size, get_http_session(),
+                                                                          task.metrics))
+                except Exception as e:
+                    task.future.set_exception(e)
+            with self._cond:
+                if self._inflight.get(task.key) is task:
+                    del self._inflight[task.key]
+
+    @contextlib.contextmanager
+    def render_slot(self, job, progress=None):
+        """Venter på en ledig plads til at bygge slides; kan afbrydes af en ny kørsel i sessionen."""
+        if not self._job_slots.acquire(blocking=False):
+            if progress:
+                progress(0.0, "Venter på ledig plads i køen...")
+            while not self._job_slots.acquire(timeout=0.2):
+                job.check()
+        try:
+            yield
+        finally:
+            self._job_slots.release()
+
+@functools.lru_cache(maxsize=None)
+def get_scheduler():
+    return JobScheduler(IMAGE_FETCH_CONCURRENCY, MAX_CONCURRENT_JOBS)
+
+def missing_slide_values(item_no):
+    """Slide-værdier for et varenummer, der ikke findes i mapping-filen."""
+    placeholder_texts = {}
+    for ph, label in TEXT_PLACEHOLDERS_ORIG.items():
+        if ph == "{{Product code}}":
+            placeholder_texts[ph] = f"{label} {item_no}"
+        else:
+            placeholder_texts[ph] = ""
+    placeholder_texts["{{Product RTS}}"] = "Product in stock versions:\n\n"
+    placeholder_texts["{{Product MTO}}"] = "Avilable for made to order:\n\n"
+    return placeholder_texts, {}, None
+
+# --- Samlet opslag og værdier for hele varelisten ---
+def format_text_value(ph, label, value):
+    if ph in ("{{Product code}}", "{{Product name}}", "{{Product country of origin}}"):
+        return f"{label} {value}"
+    if ph in ("{{CertificateName}}", "{{Product Consumption COM}}"):
+        return f"{label}\n\n{value}"
+    return f"{label}\n{value}"
+
+def column_values(rows, ph, as_text=False):
+    """
+    Returnerer (værdier, tom) for en placeholder-kolonne; tom er sand for manglende og blanke værdier.
+    Med as_text formateres værdierne efter kolonnens egen dtype (som str(værdi) på rækken) i stedet
+    for at blive konverteret til Python-tal, der kan vise repræsentationsstøj.
+    """
+    col = normalize_col(ph)
+    if col not in rows.columns:
+        return [""] * len(rows), [True] * len(rows)
+    series = rows[col]
+    text = series.astype(str)
+    blank = series.isna() | (text.str.strip() == "")
+    return (text if as_text else series).tolist(), blank.tolist()
+
+def build_row_records(rows, stock_summary):
+    """
+    Formaterer tekst-, hyperlink- og billedværdier for alle rækker i rows kolonne
+    for kolonne og returnerer én post (slide-værdier, indholdshash) pr. række.
+    Indholdshashen dækker rækkens værdier og lagerteksterne og bruges i fragment-cachen.
+    """
+    texts = {}
+    for ph, label in TEXT_PLACEHOLDERS_ORIG.items():
+        values, blank = column_values(rows, ph, as_text=True)
+        texts[ph] = ["" if is_blank else format_text_value(ph, label, value) for value, is_blank in zip(values, blank)]
+    links = {}
+    for ph, display_text in HYPERLINK_PLACEHOLDERS_ORIG.items():
+        values, blank = column_values(rows, ph)
+        links[ph] = [(display_text, "" if is_blank else value) for value, is_blank in zip(values, blank)]
+    images = {}
+    for ph in IMAGE_PLACEHOLDERS_ORIG:
+        values, blank = column_values(rows, ph)
+        images[ph] = ["" if is_blank else value for value, is_blank in zip(values, blank)]
+    product_keys = rows["productkey"].tolist() if "productkey" in rows.columns else [""] * len(rows)
+    name_col = normalize_col("{{Product name}}")
+    product_names = rows[name_col].tolist() if name_col in rows.columns else [""] * len(rows)
+    row_hashes = pd.util.hash_pandas_object(rows, index=False).tolist()
+
+    records = []
+    for i, (product_key, product_name, row_hash) in enumerate(zip(product_keys, product_names, row_hashes)):
+        rts_text, mto_text = stock_summary.texts_for(product_key, product_name)
+        placeholder_texts = {ph: texts[ph][i] for ph in TEXT_PLACEHOLDERS_ORIG}
+        placeholder_texts["{{Product RTS}}"] = f"Product in stock versions:\n\n{rts_text}"
+        placeholder_texts["{{Product MTO}}"] = f"Avilable for made to order:\n\n{mto_text}"
+        hyperlink_vals = {ph: links[ph][i] for ph in HYPERLINK_PLACEHOLDERS_ORIG}
+        image_vals = {ph: images[ph][i] for ph in IMAGE_PLACEHOLDERS_ORIG}
+        records.append(((placeholder_texts, hyperlink_vals, image_vals), stable_hash((row_hash, rts_text, mto_text))))
+    return records
+
+class ResolvedItems:
+    """Hele varelisten slået op: slide-værdier og indholdshash pr. varenummer (None for manglende) i indsat rækkefølge."""
+    def __init__(self, item_numbers, slide_values, content_hashes, missing_items):
+        self.item_numbers = item_numbers
+        self.slide_values = slide_values
+        self.content_hashes = content_hashes
+        self.missing_items = missing_items
+
+def build_slide_values(item_numbers, positions, mapping, stock):
+    """
+    Bygger slide-værdierne for varelisten ud fra positionerne fra find_positions.
+    De fundne rækker hentes i ét udsnit, og hver unik række formateres kun én gang.
+    """
+    unique_positions = list(dict.fromkeys(position for position in positions if position is not None))
+    records = dict(zip(unique_positions, build_row_records(mapping.df.iloc[unique_positions], stock.summary)))
+    slide_values = []
+    content_hashes = []
+    missing_items = []
+    for item_no, position in zip(item_numbers, positions):
+        if position is None:
+            missing_items.append(item_no)
+            slide_values.append(missing_slide_values(item_no))
+            content_hashes.append(None)
+        else:
+            values, content_hash = records[position]
+            slide_values.append(values)
+            content_hashes.append(content_hash)
+    return ResolvedItems(item_numbers, slide_values, content_hashes, missing_items)
+
+def resolve_items(item_numbers, mapping, stock, metrics=None):
+    """Slår alle varenumre op og bygger alle slide-værdier, før nogen slide bygges."""
+    with stage(metrics, "lookup"):
+        positions = mapping.index.find_positions(item_numbers)
+    with stage(metrics, "slide_values"):
+        return build_slide_values(item_numbers, positions, mapping, stock)
+
+def prefetch_images(image_values_list, target_sizes, executor=None, session=None, metrics=None, job=None):
+    """
+    Samler alle billed-URL'er for hele varelisten, fjerner dubletter og starter
+    hentningen med det samme. Returnerer {(url, størrelse): Future}, så slides kan
+    bygges sideløbende og hver slide kun venter på sine egne billeder. Med et job
+    går hentningen gennem den fælles planlægger i stedet for trådpuljen.
+    """
+    executor = executor or get_image_executor()
+    session = session or get_http_session()
+    tasks = []
+    for image_vals in image_values_list:
+        if image_vals is not None:
+            for ph, url in image_vals.items():
+                if url and ph in target_sizes:
+                    tasks.append((url, target_sizes[ph]))
+    unique_tasks = list(dict.fromkeys(tasks))
+    if metrics:
+        metrics.incr("image_requests", len(tasks))
+        metrics.incr("image_unique_requests", len(unique_tasks))
+    if job is not None:
+        return {(url, max_size): job.fetch(url, IMAGE_QUALITY, max_size, metrics) for url, max_size in unique_tasks}
+    return {(url, max_size): executor.submit(fetch_and_process_image_cached, url, IMAGE_QUALITY, max_size, session, metrics)
+            for url, max_size in unique_tasks}
+
+def report_warning(message, warnings=None):
+    logger.warning(message)
+    if warnings is not None:
+        warnings.append(message)
+
+def resolve_prefetched_image(url, max_size, prefetched, warnings=None):
+    try:
+        if (url, max_size) not in prefetched:
+            # Fx når en slide forventedes fra fragment-cachen, men er fjernet undervejs
+            image_bytes = fetch_and_process_image_cached(url, IMAGE_QUALITY, max_size, get_http_session())
+        else:
+            image_bytes = prefetched[(url, max_size)].result()
+    except Exception as e:
+        report_warning(f"Fejl ved hentning af billede fra {url}: {e}", warnings)
+        return None
+    if image_bytes is None:
+        # Billedserveren svarede uden billede, og der er ingen gemt kopi
+        report_warning(f"Fejl ved hentning af billede fra {url}: intet billede modtaget", warnings)
+    return image_bytes
+
+# --- Kompileret template ---
+def placeholder_key(placeholder):
+    return placeholder.strip("{}").strip()
+
+class CompiledTemplate:
+    """
+    Gennemgår templateslidens former én gang og husker, hvilke afsnit der
+    indeholder tekst- eller hyperlink-placeholders, og hvilke former der er
+    billed-placeholders. Alle tekst-placeholders erstattes med ét forkompileret
+    regex, og nye slides berører kun de steder, der rent faktisk har placeholders.
+    """
+    def __init__(self, template_slide):
+        text_keys = [placeholder_key(ph) for ph in list(TEXT_PLACEHOLDERS_ORIG) + ["{{Product RTS}}", "{{Product MTO}}"]]
+        hyperlink_keys = [placeholder_key(ph) for ph in HYPERLINK_PLACEHOLDERS_ORIG]
+        alternation = "|".join(re.escape(key) for key in sorted(text_keys + hyperlink_keys, key=len, reverse=True))
+        self.pattern = re.compile(r"\{\{\s*(" + alternation + r")\s*\}\}")
+        # (formindeks, afsnitsindeks) for afsnit med tekst- eller hyperlink-placeholders
+        self.paragraph_locations = []
+        # (formindeks, placeholder, bredde, højde) for billed-placeholders
+        self.image_locations = []
+        for shape_idx, shape in enumerate(template_slide.shapes):
+            if not shape.has_text_frame:
+                continue
+            for para_idx, paragraph in enumerate(shape.text_frame.paragraphs):
+                full_text = "".join(run.text for run in paragraph.runs)
+                if paragraph.runs and self.pattern.search(full_text):
+                    self.paragraph_locations.append((shape_idx, para_idx))
+            tekst = normalize_text(shape.text)
+            for ph in IMAGE_PLACEHOLDERS_ORIG:
+                if normalize_text(ph) in tekst:
+                    self.image_locations.append((shape_idx, ph, shape.width, shape.height))
+                    break
+
+    def image_target_sizes(self, dpi=None):
+        """
+        Beregner pixelstørrelsen for hver billed-placeholder ud fra formens størrelse
+        ved den ønskede DPI, så billederne kun skaleres og kodes én gang.
+        """
+        dpi = dpi or IMAGE_TARGET_DPI
+        sizes = {}
+        for _, ph, shape_width, shape_height in self.image_locations:
+            width = max(1, math.ceil(shape_width / EMU_PER_INCH * dpi))
+            height = max(1, math.ceil(shape_height / EMU_PER_INCH * dpi))
+            previous = sizes.get(ph, (0, 0))
+            sizes[ph] = (max(width, previous[0]), max(height, previous[1]))
+        return sizes
+
+    def replace_text(self, slide, placeholder_values, hyperlink_values, warnings=None):
+        """
+        Erstatter tekst- og hyperlink-placeholders. Afsnittets runs samles i det
+        første run, som også får hyperlinket. Placeholders uden værdi bevares.
+        """
+        values = {placeholder_key(ph): value for ph, value in placeholder_values.items()}
+        links = {placeholder_key(ph): (ph, display_text, url) for ph, (display_text, url) in hyperlink_values.items()}
+        shapes = list(slide.shapes)
+        for shape_idx, para_idx in self.paragraph_locations:
+            paragraph = shapes[shape_idx].text_frame.paragraphs[para_idx]
+            runs = paragraph.runs
+            full_text = "".join(run.text for run in runs)
+            link_targets = []
+
+            def substitute(match):
+                key = match.group(1)
+                if key in values:
+                    return values[key]
+                if key in links:
+                    ph, display_text, url = links[key]
+                    link_targets.append((ph, url))
+                    return display_text
+                return match.group(0)
+
+            new_text = self.pattern.sub(substitute, full_text)
+            for run in runs[1:]:
+                run.text = ""
+            runs[0].text = new_text
+            for ph, url in link_targets:
+                try:
+                    runs[0].hyperlink.address = url
+                except Exception as e:
+                    report_warning(f"Hyperlink for {ph} kunne ikke indsættes: {e}", warnings)
+
+    def resolve_images(self, image_values, target_sizes, prefetched=None, warnings=None):
+        """Venter på billederne og returnerer [(url, størrelse, bytes eller None)] pr. billed-placeholder."""
+        if prefetched is None:
+            prefetched = {}
+            for ph, url in image_values.items():
+                if url and ph in target_sizes and (url, target_sizes[ph]) not in prefetched:
+                    prefetched[(url, target_sizes[ph])] = get_image_executor().submit(
+                        fetch_and_process_image_cached, url, IMAGE_QUALITY, target_sizes[ph], get_http_session())
+        images = []
+        for _, ph, _, _ in self.image_locations:
+            url = image_values.get(ph, "")
+            image_bytes = resolve_prefetched_image(url, target_sizes[ph], prefetched, warnings) if url else None
+            images.append((url, target_sizes[ph], image_bytes))
+        return images
+
+    def place_resolved_images(self, slide, images, media):
+        """Indsætter billeder fra resolve_images og returnerer {rId: (url, størrelse)} for de indsatte billeder."""
+        pictures = {}
+        shapes = list(slide.shapes)
+        for (shape_idx, _, _, _), (url, max_size, image_bytes) in zip(self.image_locations, images):
+            if image_bytes:
+                shape = shapes[shape_idx]
+                # Kun billedets header læses for at få størrelsen – ingen ny afkodning eller kodning
+                original_width, original_height = Image.open(io.BytesIO(image_bytes)).size
+                scale = min(shape.width / original_width, shape.height / original_height)
+                new_width = int(original_width * scale)
+                new_height = int(original_height * scale)
+                rId = media.add_picture(slide, image_bytes, shape.left, shape.top, new_width, new_height)
+                pictures[rId] = (url, max_size)
+                shape.text = ""
+        return pictures
+
+    def place_images(self, slide, image_values, target_sizes, prefetched=None, warnings=None, media=None):
+        """Indsætter billederne og returnerer {rId: (url, størrelse)} for de indsatte billeder."""
+        images = self.resolve_images(image_values, target_sizes, prefetched, warnings)
+        return self.place_resolved_images(slide, images, media or MediaRegistry(slide.part.package))
+
+def duplicate_slide(prs, slide):
+    slide_layout = slide.slide_layout
+    new_slide = prs.slides.add_slide(slide_layout)
+    new_slide.shapes._spTree.clear()
+    for shape in slide.shapes:
+        new_slide.shapes._spTree.append(deepcopy(shape._element))
+    # Fjern eventuelle hidden-tags, så sliden vises korrekt
+    for elem in new_slide._element.xpath('.//p:hiddenslide'):
+        elem.getparent().remove(elem)
+    return new_slide
+
+def delete_slide(prs, slide_index):
+    slide_id = prs.slides._sldIdLst[slide_index]
+    rId = slide_id.rId
+    prs.part.drop_rel(rId)
+    prs.slides._sldIdLst.remove(slide_id)
+
+# --- Slide-fragmenter til parallel rendering og genbrug ---
+def slide_to_fragment(slide, pictures=None):
+    """
+    Serialiserer en færdig slides former til XML sammen med dens hyperlinks og
+    billedreferencer, så sliden kan bygges i en workerproces eller genbruges fra
+    fragment-cachen og indsættes i en anden præsentation. Billederne gemmes kun
+    som (url, størrelse); selve bytes ligger i billedcachen.
+    """
+    hyperlinks = {}
+    for rId in slide._element.xpath(".//a:hlinkClick/@r:id"):
+        if rId in slide.part.rels:
+            hyperlinks[rId] = slide.part.rels[rId].target_ref
+    shapes_xml = [etree.tostring(shape._element) for shape in slide.shapes]
+    return shapes_xml, hyperlinks, dict(pictures or {})
+
+# --- Billeddele i præsentationen ---
+class MediaRegistry:
+    """
+    Præsentationens billeddele efter SHA-1. python-pptx' get_or_add_image_part
+    gennemløber hele pakken for hvert billede (både ved dubletsøgning og navngivning),
+    hvilket bliver kvadratisk i antal slides. Her gennemløbes pakken én gang, og
+    nye dele slås op og navngives i konstant tid; samme billede gemmes kun én gang.
+    """
+    def __init__(self, package):
+        self.package = package
+        self.parts = {}
+        self.next_index = 1
+        for part in package.iter_parts():
+            if isinstance(part, ImagePart):
+                self.parts.setdefault(part.sha1, part)
+                if part.partname.startswith("/ppt/media/image") and part.partname.idx is not None:
+                    self.next_index = max(self.next_index, part.partname.idx + 1)
+
+    def get_or_add(self, image_bytes):
+        image = PptxImage.from_blob(image_bytes)
+        return self.get_or_add_known(image.sha1, image.ext, image.content_type, image.blob)
+
+    def get_or_add_known(self, sha1, ext, content_type, image_bytes):
+        """Som get_or_add, når billedets SHA-1, endelse og indholdstype allerede er kendt (fx fra en worker)."""
+        part = self.parts.get(sha1)
+        if part is None:
+            partname = PackURI(f"/ppt/media/image{self.next_index}.{ext}")
+            self.next_index += 1
+            part = ImagePart(partname, content_type, self.package, image_bytes)
+            self.parts[sha1] = part
+        return part
+
+    def relate(self, slide, image_bytes):
+        """Knytter billedet til sliden og returnerer relationens rId."""
+        return slide.part.relate_to(self.get_or_add(image_bytes), RT.IMAGE)
+
+    def add_picture(self, slide, image_bytes, left, top, width, height):
+        """Som slide.shapes.add_picture, men med opslag i registret. Returnerer billedets rId."""
+        image_part = self.get_or_add(image_bytes)
+        rId = slide.part.relate_to(image_part, RT.IMAGE)
+        slide.shapes._add_pic_from_image_part(image_part, rId, left, top, width, height)
+        return rId
+
+def append_slide_fragment(prs, slide_layout, fragment, metrics=None, media=None, image_parts=None):
+    """
+    Indsætter et fragment som ny slide. image_parts giver billeddelene pr. rId direkte
+    (fra workerne); ellers hentes fragmentets billeder fra billedcachen.
+    """
+    shapes_xml, hyperlinks, pictures = fragment
+    if image_parts is None:
+        # Billederne hentes før sliden oprettes, så et manglende billede ikke efterlader en halv slide
+        picture_bytes = {}
+        for old_rId, (url, max_size) in pictures.items():
+            picture_bytes[old_rId] = fetch_and_process_image_cached(url, IMAGE_QUALITY, max_size, get_http_session(),
+                                                                    metrics)
+            if picture_bytes[old_rId] is None:
+                raise LookupError(f"Billedet {url} findes ikke længere")
+        if picture_bytes:
+            media = media or MediaRegistry(prs.part.package)
+        # Registret genbruger eksisterende billeddele med samme indhold
+        image_parts = {old_rId: media.get_or_add(image_bytes) for old_rId, image_bytes in picture_bytes.items()}
+    new_slide = prs.slides.add_slide(slide_layout)
+    new_slide.shapes._spTree.clear()
+    rId_map = {old_rId: new_slide.part.relate_to(url, RT.HYPERLINK, is_external=True)
+               for old_rId, url in hyperlinks.items()}
+    for old_rId, image_part in image_parts.items():
+        rId_map[old_rId] = new_slide.part.relate_to(image_part, RT.IMAGE)
+    for shape_xml in shapes_xml:
+        element = parse_xml(shape_xml)
+        for link in element.xpath(".//a:hlinkClick[@r:id]"):
+            link.set(qn("r:id"), rId_map.get(link.get(qn("r:id")), link.get(qn("r:id"))))
+        for blip in element.xpath(".//a:blip[@r:embed]"):
+            blip.set(qn("r:embed"), rId_map.get(blip.get(qn("r:embed")), blip.get(qn("r:embed"))))
+        new_slide.shapes._spTree.append(element)
+    return new_slide
+
+# --- Cache med færdigrenderede slides pr. vare ---
+class FragmentCache:
+    """
+    Processens cache over færdige slide-fragmenter. Nøglen dækker varenummer,
+    mapping-rækken, lagerteksterne, templaten og billedindstillingerne, så kun
+    nye eller ændrede varer renderes igen. Mindst nyligt brugte fragmenter
+    fjernes, når den samlede XML-størrelse overstiger max_bytes.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._fragments = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fragment_size(fragment):
+        return sum(len(shape_xml) for shape_xml in fragment[0])
+
+    def get(self, key):
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+            return fragment
+
+    def put(self, key, fragment):
+        size = self.fragment_size(fragment)
+        with self._lock:
+            if key in self._fragments:
+                self.total_bytes -= self.fragment_size(self._fragments.pop(key))
+            self._fragments[key] = fragment
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and self._fragments:
+                _, evicted = self._fragments.popitem(last=False)
+                self.total_bytes -= self.fragment_size(evicted)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._fragments
+
+@functools.lru_cache(maxsize=None)
+def get_fragment_cache():
+    return FragmentCache(FRAGMENT_CACHE_MAX_BYTES)
+
+def stable_hash(value):
+    return hashlib.sha1(repr(value).encode("utf-8")).hexdigest()
+
+def fragment_key(item_no, content_hash, template):
+    """Nøgle for en vares slide: varenummer, hash af mapping-række og lagertekster samt templatens fingeraftryk."""
+    return (item_no, content_hash, template.fingerprint, IMAGE_TARGET_DPI, IMAGE_QUALITY)
+
+# Tilstand i workerprocesserne: templaten indlæses og kompileres én gang pr. worker
+_worker_state = {}
+
+def init_render_worker(template_path):
+    prs, _, template_slide = load_template_presentation(template_path)
+    _worker_state["prs"] = prs
+    _worker_state["template_slide"] = template_slide
+    _worker_state["compiled_template"] = CompiledTemplate(template_slide)
+
+def render_fragment(values):
+    """
+    Bygger én slide i workeren: tekst, hyperlinks og billeder fra de medsendte bytes.
+    Returnerer (fragment, {rId: (sha1, endelse, indholdstype)} for billederne, advarsler).
+    """
+    placeholder_texts, hyperlink_vals, images = values
+    prs = _worker_state["prs"]
+    compiled_template = _worker_state["compiled_template"]
+    slide = duplicate_slide(prs, _worker_state["template_slide"])
+    warnings = []
+    compiled_template.replace_text(slide, placeholder_texts, hyperlink_vals, warnings)
+    pictures = compiled_template.place_resolved_images(slide, images, MediaRegistry(prs.part.package))
+    image_info = {}
+    for rId in pictures:
+        image_part = slide.part.related_part(rId)
+        image_info[rId] = (image_part.sha1, image_part.partname.ext, image_part.content_type)
+    fragment = slide_to_fragment(slide, pictures)
+    # Arbejdsslidens del slippes igen, så workeren ikke vokser med antallet af slides
+    delete_slide(prs, len(prs.slides) - 1)
+    return fragment, image_info, warnings
+
+def render_fragment_batch(values_list):
+    return [render_fragment(values) for values in values_list]
+
+@functools.lru_cache(maxsize=1)
+def get_render_pool(template_path, fingerprint):
+    """Processpulje til parallel rendering; hver worker indlæser og kompilerer templaten én gang."""
+    return ProcessPoolExecutor(max_workers=RENDER_PROCESSES,
+                               mp_context=multiprocessing.get_context("spawn"),
+                               initializer=init_render_worker,
+                               initargs=(template_path,))
+
+# --- Opbygning og lagring af præsentationer ---
+def load_template_presentation(template_path):
+    """Indlæser templaten og returnerer (præsentation, kopi af templateslide, templateslide) uden templateslide."""
+    prs = Presentation(template_path)
+    if len(prs.slides) < 1:
+        raise ValueError("Template-filen skal indeholde mindst én slide.")
+    # Lav en kopi af den originale templateslide og slet den originale
+    template_slide = prs.slides[0]
+    template_copy = deepcopy(template_slide)
+    delete_slide(prs, 0)
+    return prs, template_copy, template_slide
+
+def render_slides(prs, template_copy, template, slide_jobs, prefetched_images, fragments=None,
+                  warnings=None, metrics=None, fragment_cache=None, job=None, media=None):
+    """
+    Bygger én slide pr. job i rækkefølge. Et job er (slide-værdier, fragmentnøgle, fra worker).
+    Findes nøglen i fragment-cachen, samles sliden af det gemte fragment; ellers
+    renderes den – med fra worker sat bruges næste fragment fra workerprocesserne –
+    og lægges i cachen bagefter. Et annulleret job stoppes før næste slide.
+    media er præsentationens MediaRegistry; giv den samme ved flere kald på samme præsentation.
+    """
+    media = media or MediaRegistry(prs.part.package)
+    for (placeholder_texts, hyperlink_vals, image_vals), key, from_worker in slide_jobs:
+        if job is not None:
+            job.check()
+        if from_worker:
+            worker_fragment = next(fragments)
+        cached = fragment_cache.get(key) if fragment_cache is not None and key is not None else None
+        if cached is not None:
+            try:
+                with stage(metrics, "slide_from_cache"):
+                    append_slide_fragment(prs, template_copy.slide_layout, cached, metrics, media)
+                if metrics:
+                    metrics.incr("fragment_cache_hit")
+                continue
+            except Exception as e:
+                logger.info(f"Fragment kunne ikke genbruges og renderes igen: {e}")
+        if metrics and fragment_cache is not None:
+            metrics.incr("fragment_cache_miss")
+        # Advarsler samles pr. slide, så kun fejlfri slides lægges i cachen
+        slide_warnings = []
+        if from_worker:
+            fragment, worker_images, fragment_warnings = worker_fragment
+            slide_warnings.extend(fragment_warnings)
+            with stage(metrics, "slide_from_worker"):
+                # Workeren har bygget billederne; her slås delene kun op efter SHA-1
+                image_parts = {rId: media.get_or_add_known(*image) for rId, image in worker_images.items()}
+                slide = append_slide_fragment(prs, template_copy.slide_layout, fragment, image_parts=image_parts)
+            pictures = fragment[2]
+        else:
+            with stage(metrics, "slide_text"):
+                slide = duplicate_slide(prs, template_copy)
+                template.compiled_template.replace_text(slide, placeholder_texts, hyperlink_vals, slide_warnings)
+            pictures = {}
+            if image_vals is not None:
+                with stage(metrics, "slide_images"):
+                    pictures = template.compiled_template.place_images(slide, image_vals, template.image_sizes,
+                                                                       prefetched_images, slide_warnings, media)
+        if warnings is not None:
+            warnings.extend(slide_warnings)
+        if fragment_cache is not None and key is not None and not slide_warnings:
+            fragment_cache.put(key, slide_to_fragment(slide, pictures))
+
+def plan_slide_jobs(slide_values, keys, fragment_cache, parallel):
+    """
+    Afgør for hver vare, om sliden kan tages fra fragment-cachen. Gentagne varer i
+    samme liste renderes kun første gang. Ved parallel rendering markeres de
+    resterende til workerne.
+    """
+    jobs = []
+    seen = set()
+    for values, key in zip(slide_values, keys):
+        needs_render = key is None or (key not in seen and (fragment_cache is None or key not in fragment_cache))
+        seen.add(key)
+        jobs.append((values, key, parallel and needs_render))
+    return jobs
+
+def jobs_image_values(slide_jobs, fragment_cache=None):
+    """Billed-URL'erne for de jobs, der faktisk skal renderes; cachede slides har allerede deres billeder."""
+    return [image_vals for (_, _, image_vals), key, _ in slide_jobs
+            if fragment_cache is None or key is None or key not in fragment_cache]
+
+# --- Hurtig gemning af præsentationer ---
+def is_precompressed_part(part):
+    return part.content_type in PRECOMPRESSED_CONTENT_TYPES or part.content_type.startswith(("video/", "audio/"))
+
+def save_presentation(prs, target, compress_level=None):
+    """
+    Gemmer præsentationen som .pptx i target (sti eller fil-lignende objekt).
+    I modsætning til prs.save deflates kun XML-delene – med compress_level –
+    mens JPEG og andre allerede komprimerede medier gemmes ukomprimeret.
+    Arkivet skrives løbende til target i stedet for at blive bygget i hukommelsen.
+    Dele med samme navn (fx layouts fra den kopierede templateslide) skrives kun én gang.
+    """
+    if compress_level is None:
+        compress_level = XML_COMPRESS_LEVEL
+    package = prs.part.package
+    parts = []
+    partnames = set()
+    for part in package.iter_parts():
+        if part.partname not in partnames:
+            partnames.add(part.partname)
+            parts.append(part)
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=compress_level,
+                         strict_timestamps=False) as archive:
+        archive.writestr(CONTENT_TYPES_URI.membername, serialize_part_xml(_ContentTypesItem.xml_for(parts)))
+        archive.writestr(PACKAGE_URI.rels_uri.membername, package._rels.xml)
+        for part in parts:
+            if is_precompressed_part(part):
+                archive.writestr(part.partname.membername, part.blob, compress_type=zipfile.ZIP_STORED)
+            else:
+                archive.writestr(part.partname.membername, part.blob)
+            if part._rels:
+                archive.writestr(part.partname.rels_uri.membername, part.rels.xml)
+
+def cleanup_output_dir(directory=OUTPUT_DIR, max_age=OUTPUT_MAX_AGE):
+    """Fjerner gamle kørselsmapper med delfiler og zip-arkiver fra directory."""
+    if not os.path.isdir(directory):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.getmtime(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+
+def render_deck_parts(template, slide_jobs, part_size, parallel=False, on_part_done=None, warnings=None, metrics=None,
+                      fragment_cache=None, compress_level=None, job=None):
+    """
+    Renderer varerne i delpræsentationer med part_size varer i hver. Hver del gemmes
+    på disk, så snart den er færdig, og slippes derefter, så hukommelsesforbruget
+    ikke vokser med listens længde. Billederne – og ved parallel rendering
+    workernes fragmenter – til næste del hentes, mens den aktuelle del bygges.
+    Returnerer stien til et zip-arkiv med alle delene.
+    """
+    cleanup_output_dir()
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    run_dir = tempfile.mkdtemp(prefix="deck-", dir=OUTPUT_DIR)
+    chunks = [slide_jobs[start:start + part_size] for start in range(0, len(slide_jobs), part_size)]
+    part_paths = []
+    image_sizes = template.image_sizes
+    prefetched_images = prefetch_images(jobs_image_values(chunks[0], fragment_cache), image_sizes,
+                                        metrics=metrics, job=job) if chunks else {}
+    fragments = render_fragments(template, chunks[0], prefetched_images) if parallel and chunks else None
+    for part_index, chunk in enumerate(chunks):
+        if part_index + 1 < len(chunks):
+            next_chunk = chunks[part_index + 1]
+            next_prefetched = prefetch_images(jobs_image_values(next_chunk, fragment_cache), image_sizes,
+                                              metrics=metrics, job=job)
+            next_fragments = render_fragments(template, next_chunk, next_prefetched) if parallel else None
+        else:
+            next_prefetched, next_fragments = {}, None
+        prs, template_copy, _ = load_template_presentation(template.path)
+        with stage(metrics, "render"):
+            render_slides(prs, template_copy, template, chunk, prefetched_images,
+                          fragments, warnings, metrics, fragment_cache, job)
+        part_path = os.path.join(run_dir, f"generated_presentation_part{part_index + 1:03d}.pptx")
+        with stage(metrics, "save"):
+            save_presentation(prs, part_path, compress_level)
+        part_paths.append(part_path)
+        del prs, template_copy
+        prefetched_images, fragments = next_prefetched, next_fragments
+        if on_part_done:
+            on_part_done(part_index + 1, len(chunks))
+
+    zip_path = os.path.join(run_dir, "generated_presentations.zip")
+    # Præsentationerne er allerede komprimerede, så de gemmes ukomprimeret i arkivet
+    with stage(metrics, "zip"), zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as archive:
+        for part_path in part_paths:
+            archive.write(part_path, arcname=os.path.basename(part_path))
+            os.remove(part_path)
+    return zip_path
+
+# --- Indlæste data, der kan genbruges på tværs af kald ---
+MAPPING_PRODUCT_CODE_KEY = normalize_col("{{Product code}}")
+
+class MappingData:
+    """Mapping-filen som DataFrame med tilhørende opslagsindeks."""
+    def __init__(self, path, fingerprint, df, index):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.df = df
+        self.index = index
+
+class StockData:
+    """Stock-filen som DataFrame med forberegnede RTS/MTO-tekster."""
+    def __init__(self, path, fingerprint, df, summary):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.df = df
+        self.summary = summary
+
+class TemplateData:
+    """Templatefilen med kompileret placeholder-kort og billedstørrelser."""
+    def __init__(self, path, fingerprint, compiled_template, image_sizes):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.compiled_template = compiled_template
+        self.image_sizes = image_sizes
+
+class DeckResult:
+    """Resultatet af generate_deck: bytes eller filsti, manglende varenumre, advarsler og ydelsesrapport."""
+    def __init__(self, output, missing_items, warnings, metrics=None):
+        self.output = output
+        self.missing_items = missing_items
+        self.warnings = warnings
+        self.metrics = metrics
+
+# Samtidige kald (fx opvarmningen og den første bruger) venter på hinanden i stedet for at indlæse filerne to gange
+_data_load_lock = threading.Lock()
+
+def load_mapping(path=MAPPING_FILE_PATH):
+    with _data_load_lock:
+        return _load_mapping(os.path.abspath(path), file_fingerprint(path))
+
+@functools.lru_cache(maxsize=4)
+def _load_mapping(path, fingerprint):
+    return build_mapping_data(path, fingerprint, read_mapping_df(path, fingerprint))
+
+def read_mapping_df(path, fingerprint):
+    required_cols = [normalize_col(col) for col in REQUIRED_MAPPING_COLS_ORIG]
+    mapping_df = read_excel_snapshot(path, fingerprint, required_cols)
+    missing_cols = [req for req in required_cols if req not in mapping_df.columns]
+    if missing_cols:
+        raise ValueError(f"Mapping-filen mangler kolonner: {missing_cols}.")
+    return mapping_df
+
+def build_mapping_data(path, fingerprint, mapping_df, codes=None, previous=None, changed_codes=None):
+    """Med previous opdateres dens indeks kun for changed_codes i stedet for at blive bygget forfra."""
+    if previous is None:
+        index = MappingIndex(mapping_df, MAPPING_PRODUCT_CODE_KEY, codes)
+    else:
+        if codes is None:
+            codes = normalize_series(mapping_df[MAPPING_PRODUCT_CODE_KEY]).tolist()
+        index = previous.index.with_changes(mapping_df, codes, changed_codes)
+    return MappingData(path, fingerprint, mapping_df, index)
+
+def load_stock(path=STOCK_FILE_PATH):
+    with _data_load_lock:
+        return _load_stock(os.path.abspath(path), file_fingerprint(path))
+
+@functools.lru_cache(maxsize=4)
+def _load_stock(path, fingerprint):
+    return build_stock_data(path, fingerprint, read_stock_df(path, fingerprint))
+
+def read_stock_df(path, fingerprint):
+    required_cols = [normalize_col(col) for col in REQUIRED_STOCK_COLS_ORIG]
+    stock_df = read_excel_snapshot(path, fingerprint, required_cols)
+    missing_cols = [req for req in required_cols if req not in stock_df.columns]
+    if missing_cols:
+        raise ValueError(f"Stock-filen mangler kolonner: {missing_cols}.")
+    return stock_df
+
+def build_stock_data(path, fingerprint, stock_df, previous=None, changed_keys=None):
+    summary = StockSummary(stock_df, previous.summary if previous else None, changed_keys)
+    return StockData(path, fingerprint, stock_df, summary)
+
+def load_template(path=TEMPLATE_FILE_PATH):
+    with _data_load_lock:
+        return _load_template(os.path.abspath(path), file_fingerprint(path))
+
+@functools.lru_cache(maxsize=4)
+def _load_template(path, fingerprint):
+    _, _, template_slide = load_template_presentation(path)
+    compiled_template = CompiledTemplate(template_slide)
+    return TemplateData(path, fingerprint, compiled_template, compiled_template.image_target_sizes())
+
+# --- Levende katalog med ændringsdetektion ---
+def row_hashes_by_key(df, keys):
+    """Returnerer {nøgle: tuple af rækkehashes i filens rækkefølge}, så to versioner kan sammenlignes pr. nøgle."""
+    hashes_by_key = {}
+    for key, row_hash in zip(keys.tolist(), pd.util.hash_pandas_object(df, index=False).tolist()):
+        hashes_by_key.setdefault(key, []).append(row_hash)
+    return {key: tuple(hashes) for key, hashes in hashes_by_key.items()}
+
+def diff_keys(old_hashes, new_hashes):
+    """Returnerer (tilføjede, ændrede, fjernede) nøgler mellem to versioner."""
+    added = new_hashes.keys() - old_hashes.keys()
+    removed = old_hashes.keys() - new_hashes.keys()
+    changed = {key for key in new_hashes.keys() & old_hashes.keys() if new_hashes[key] != old_hashes[key]}
+    return added, changed, removed
+
+class CatalogChanges:
+    """Normaliserede varenumre og produktnøgler, der blev tilføjet, ændret eller fjernet ved seneste opdatering."""
+    def __init__(self, mapping_added=(), mapping_changed=(), mapping_removed=(),
+                 stock_added=(), stock_changed=(), stock_removed=()):
+        self.mapping_added = set(mapping_added)
+        self.mapping_changed = set(mapping_changed)
+        self.mapping_removed = set(mapping_removed)
+        self.stock_added = set(stock_added)
+        self.stock_changed = set(stock_changed)
+        self.stock_removed = set(stock_removed)
+
+    def changed_product_codes(self):
+        return self.mapping_added | self.mapping_changed | self.mapping_removed
+
+    def changed_product_keys(self):
+        return self.stock_added | self.stock_changed | self.stock_removed
+
+    def __bool__(self):
+        return bool(self.changed_product_codes() or self.changed_product_keys())
+
+    def summary(self):
+        return (f"mapping: {len(self.mapping_added)} nye, {len(self.mapping_changed)} ændrede, "
+                f"{len(self.mapping_removed)} fjernede varenumre; stock: {len(self.stock_added)} nye, "
+                f"{len(self.stock_changed)} ændrede, {len(self.stock_removed)} fjernede produktnøgler")
+
+class CatalogSnapshot:
+    """
+    Én sammenhængende version af mapping- og stock-data. Et snapshot ændres aldrig;
+    en opdatering laver et nyt, så igangværende genereringer bruger samme data hele vejen.
+    """
+    def __init__(self, version, mapping, stock, mapping_hashes, stock_hashes, changes, loaded_at):
+        self.version = version
+        self.mapping = mapping
+        self.stock = stock
+        self.mapping_hashes = mapping_hashes
+        self.stock_hashes = stock_hashes
+        self.changes = changes
+        self.loaded_at = loaded_at
+
+class CatalogStore:
+    """
+    Processens levende katalog over mapping- og stock-filen. refresh() tjekker
+    filernes fingeraftryk og indlæser kun en fil, der er ændret. Den nye version
+    sammenlignes række for række med den indlæste pr. varenummer og produktnøgle;
+    opslagsindekset opdateres kun for de ændrede varenumre, og RTS/MTO-teksterne
+    beregnes kun igen for de ændrede produktnøgler.
+    Med watch() tjekker en baggrundstråd filerne hvert poll_interval sekund.
+    """
+    def __init__(self, mapping_path, stock_path):
+        self.mapping_path = mapping_path
+        self.stock_path = stock_path
+        self.last_error = None
+        self._snapshot = None
+        self._refresh_lock = threading.Lock()
+        self._watcher = None
+
+    def snapshot(self):
+        """Det aktuelle snapshot; indlæses første gang det bruges."""
+        snapshot = self._snapshot
+        return snapshot if snapshot is not None else self.refresh()
+
+    def refresh(self):
+        """Indlæser ændrede filer og returnerer det aktuelle snapshot. Fejl i en ny version beholder den gamle."""
+        with self._refresh_lock:
+            try:
+                self._snapshot = self._load_changes(self._snapshot)
+                self.last_error = None
+            except Exception as e:
+                if self._snapshot is None:
+                    raise
+                self.last_error = str(e)
+                logger.warning(f"Katalogfilerne kunne ikke genindlæses; bruger version {self._snapshot.version}: {e}")
+            return self._snapshot
+
+    def _load_changes(self, current):
+        mapping_fingerprint = file_fingerprint(self.mapping_path)
+        stock_fingerprint = file_fingerprint(self.stock_path)
+        if (current is not None and current.mapping.fingerprint == mapping_fingerprint
+                and current.stock.fingerprint == stock_fingerprint):
+            return current
+
+        changes = CatalogChanges()
+        if current is not None and current.mapping.fingerprint == mapping_fingerprint:
+            mapping, mapping_hashes = current.mapping, current.mapping_hashes
+        else:
+            mapping_df = read_mapping_df(os.path.abspath(self.mapping_path), mapping_fingerprint)
+            codes = normalize_series(mapping_df[MAPPING_PRODUCT_CODE_KEY])
+            mapping_hashes = row_hashes_by_key(mapping_df, codes)
+            if current is None:
+                mapping = build_mapping_data(os.path.abspath(self.mapping_path), mapping_fingerprint, mapping_df,
+                                             codes.tolist())
+            else:
+                changes.mapping_added, changes.mapping_changed, changes.mapping_removed = diff_keys(
+                    current.mapping_hashes, mapping_hashes)
+                mapping = build_mapping_data(os.path.abspath(self.mapping_path), mapping_fingerprint, mapping_df,
+                                             codes.tolist(), current.mapping, changes.changed_product_codes())
+
+        if current is not None and current.stock.fingerprint == stock_fingerprint:
+            stock, stock_hashes = current.stock, current.stock_hashes
+        else:
+            stock_df = read_stock_df(os.path.abspath(self.stock_path), stock_fingerprint)
+            stock_hashes = row_hashes_by_key(stock_df, normalize_series(stock_df["productkey"]))
+            if current is None:
+                stock = build_stock_data(os.path.abspath(self.stock_path), stock_fingerprint, stock_df)
+            else:
+                changes.stock_added, changes.stock_changed, changes.stock_removed = diff_keys(
+                    current.stock_hashes, stock_hashes)
+                stock = build_stock_data(os.path.abspath(self.stock_path), stock_fingerprint, stock_df,
+                                         current.stock, changes.changed_product_keys())
+
+        version = 1 if current is None else current.version + 1
+        if current is not None:
+            logger.info(f"Katalog opdateret til version {version} – {changes.summary()}")
+        return CatalogSnapshot(version, mapping, stock, mapping_hashes, stock_hashes, changes, time.time())
+
+    def watch(self, poll_interval=None):
+        """Starter baggrundstråden, der holder kataloget opdateret. Kaldes flere gange, startes kun én tråd."""
+        poll_interval = CATALOG_POLL_INTERVAL if poll_interval is None else poll_interval
+        if self._watcher is None and poll_interval > 0:
+            self._watcher = threading.Thread(target=self._watch, args=(poll_interval,), name="catalog-watch",
+                                             daemon=True)
+            self._watcher.start()
+        return self
+
+    def _watch(self, poll_interval):
+        while True:
+            time.sleep(poll_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Katalogfilerne kunne ikke indlæses: {e}")
+
+@functools.lru_cache(maxsize=None)
+def get_catalog_store(mapping_path=MAPPING_FILE_PATH, stock_path=STOCK_FILE_PATH):
+    """Processens fælles katalog for filparret; filerne overvåges i baggrunden."""
+    return CatalogStore(mapping_path, stock_path).watch()
+
+def render_slot(job, progress=None):
+    if job is None:
+        return contextlib.nullcontext()
+    return job.scheduler.render_slot(job, progress)
+
+def render_fragments(template, slide_jobs, prefetched_images):
+    """
+    Lader workerne bygge de jobs, der er markeret til dem, med tekst, hyperlinks og
+    billeder. Billederne løses her og sendes med som bytes. Jobs sendes i bidder af
+    RENDER_CHUNK_SIZE og kun få bidder forud, så fragmenterne ikke hober sig op.
+    Giver (fragment, {rId: (sha1, endelse, indholdstype, bytes)}, advarsler) i rækkefølge.
+    """
+    render_pool = get_render_pool(template.path, template.fingerprint)
+    compiled_template = template.compiled_template
+    worker_values = [values for values, _, from_worker in slide_jobs if from_worker]
+    batches = iter([worker_values[start:start + RENDER_CHUNK_SIZE]
+                    for start in range(0, len(worker_values), RENDER_CHUNK_SIZE)])
+    pending = collections.deque()
+
+    def submit(batch):
+        tasks, image_warnings = [], []
+        for placeholder_texts, hyperlink_vals, image_vals in batch:
+            slide_warnings = []
+            images = compiled_template.resolve_images(image_vals, template.image_sizes, prefetched_images,
+                                                      slide_warnings) if image_vals is not None else []
+            tasks.append((placeholder_texts, hyperlink_vals, images))
+            image_warnings.append(slide_warnings)
+        pending.append((render_pool.submit(render_fragment_batch, tasks), tasks, image_warnings))
+
+    # To bidder pr. worker holder workerne beskæftiget, mens næste bid gøres klar
+    for batch in itertools.islice(batches, 2 * RENDER_PROCESSES):
+        submit(batch)
+    while pending:
+        future, tasks, image_warnings = pending.popleft()
+        results = future.result()
+        next_batch = next(batches, None)
+        if next_batch is not None:
+            submit(next_batch)
+        for (_, _, images), (fragment, image_info, worker_warnings), slide_warnings in zip(tasks, results,
+                                                                                          image_warnings):
+            image_bytes = {(url, max_size): data for url, max_size, data in images}
+            worker_images = {rId: image_info[rId] + (image_bytes[fragment[2][rId]],) for rId in image_info}
+            # Samme rækkefølge som ved serial rendering: tekstadvarsler før billedadvarsler
+            yield fragment, worker_images, worker_warnings + slide_warnings
+
+def generate_deck(item_numbers, mapping, stock, template, output=None, part_size=None, parallel=False, progress=None,
+                  metrics=None, use_fragment_cache=True, compress_level=None, job=None):
+    """
+    Genererer en præsentation med én slide pr. varenummer.
+
+    Uden output returneres præsentationen som bytes; ellers gemmes den på stien.
+    Med part_size opdeles den i delfiler, og resultatet er stien til et zip-arkiv.
+    progress kaldes med (andel færdig, statusbesked). Tider og tællere samles i
+    metrics (en ny Metrics, hvis ingen gives), og rapporten lægges på resultatet.
+    Med use_fragment_cache genbruges færdige slides fra tidligere kald, så kun
+    nye eller ændrede varer renderes. compress_level styrer komprimeringen af
+    XML-delene ved gemning (standard XML_COMPRESS_LEVEL). Med et job fra
+    get_scheduler().start_job hentes billederne gennem den fælles planlægger,
+    slides bygges først, når der er en ledig plads, og GenerationCancelled
+    rejses, hvis jobbet annulleres undervejs.
+    """
+    metrics = metrics or Metrics()
+    item_numbers = [str(item_no).strip() for item_no in item_numbers if str(item_no).strip()]
+    # Alle varer slås op, og alle værdier bygges, før den første slide
+    resolved = resolve_items(item_numbers, mapping, stock, metrics)
+    missing_items = resolved.missing_items
+    metrics.incr("items", len(item_numbers))
+    metrics.incr("missing_items", len(missing_items))
+    fragment_cache = get_fragment_cache() if use_fragment_cache else None
+    with metrics.stage("plan"):
+        keys = [fragment_key(item_no, content_hash, template)
+                for item_no, content_hash in zip(item_numbers, resolved.content_hashes)]
+        slide_jobs = plan_slide_jobs(resolved.slide_values, keys, fragment_cache, parallel)
+    warnings = []
+
+    if part_size:
+        def on_part_done(part_number, part_count):
+            if progress:
+                progress(part_number / part_count, f"Del {part_number} af {part_count} gemt.")
+        with render_slot(job, progress):
+            zip_path = render_deck_parts(template, slide_jobs, part_size, parallel, on_part_done, warnings, metrics,
+                                         fragment_cache, compress_level, job)
+        if output is not None:
+            shutil.move(zip_path, output)
+            zip_path = output
+        return DeckResult(zip_path, missing_items, warnings, metrics.finish())
+
+    prs, template_copy, _ = load_template_presentation(template.path)
+    media = MediaRegistry(prs.part.package)
+    # Billederne hentes i baggrunden, mens slides bygges
+    prefetched_images = prefetch_images(jobs_image_values(slide_jobs, fragment_cache), template.image_sizes,
+                                        metrics=metrics, job=job)
+    # Workerne bygger hele slides; her slås billeddelene kun op, og sliderne indsættes i rækkefølge
+    fragments = render_fragments(template, slide_jobs, prefetched_images) if parallel else None
+    num_batches = math.ceil(len(slide_jobs) / PROGRESS_BATCH_SIZE)
+    with render_slot(job, progress):
+        with metrics.stage("render"):
+            for batch_index in range(num_batches):
+                if progress:
+                    progress(batch_index / num_batches, f"Behandler batch {batch_index + 1} af {num_batches}...")
+                render_slides(prs, template_copy, template,
+                              slide_jobs[batch_index * PROGRESS_BATCH_SIZE : (batch_index + 1) * PROGRESS_BATCH_SIZE],
+                              prefetched_images, fragments, warnings, metrics, fragment_cache, job, media)
+        if progress:
+            progress(1.0, "Generering fuldført!")
+
+        with metrics.stage("save"):
+            if output is None:
+                ppt_io = io.BytesIO()
+                save_presentation(prs, ppt_io, compress_level)
+                output = ppt_io.getvalue()
+            else:
+                save_presentation(prs, output, compress_level)
+    return DeckResult(output, missing_items, warnings, metrics.finish())
+
+# --- Opvarmning ved serverstart ---
+class Warmup:
+    """
+    Indlæser og indekserer mapping- og stock-data, kompilerer templaten og henter
+    billederne til populære varer i en baggrundstråd, så den første bruger efter
+    en genstart ikke betaler for det. status() giver et øjebliksbillede af forløbet.
+    """
+    def __init__(self, items_file, mapping_path, stock_path, template_path):
+        self.items_file = items_file
+        self.mapping_path = mapping_path
+        self.stock_path = stock_path
+        self.template_path = template_path
+        self.metrics = Metrics()
+        self.report = None
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+        self._state = "venter"
+        self._fraction = 0.0
+        self._message = "Opvarmning er ikke startet."
+        self._error = None
+
+    def start(self):
+        threading.Thread(target=self.run, name="warmup", daemon=True).start()
+        return self
+
+    def _update(self, fraction, message, state="kører"):
+        with self._lock:
+            self._state = state
+            self._fraction = fraction
+            self._message = message
+
+    def status(self):
+        with self._lock:
+            return {"state": self._state, "fraction": self._fraction, "message": self._message,
+                    "error": self._error, "elapsed": self.report["elapsed"] if self.report else time.time() - self.metrics.started_at}
+
+    def run(self):
+        try:
+            self._update(0.0, "Indlæser mapping- og stock-fil...")
+            with self.metrics.stage("load_catalog"):
+                snapshot = get_catalog_store(self.mapping_path, self.stock_path).snapshot()
+            mapping, stock = snapshot.mapping, snapshot.stock
+            self._update(0.35, "Indlæser PowerPoint-template...")
+            with self.metrics.stage("load_template"):
+                template = load_template(self.template_path)
+            item_numbers = read_item_numbers(self.items_file) if os.path.exists(self.items_file) else []
+            resolved = resolve_items(item_numbers, mapping, stock, self.metrics)
+            job = get_scheduler().start_job("opvarmning")
+            try:
+                prefetched = prefetch_images([image_vals for _, _, image_vals in resolved.slide_values],
+                                             template.image_sizes, metrics=self.metrics, job=job)
+                with self.metrics.stage("image_fetch"):
+                    for count, future in enumerate(concurrent.futures.as_completed(prefetched.values()), start=1):
+                        if future.exception() is not None:
+                            logger.info(f"Opvarmning: billede kunne ikke hentes: {future.exception()}")
+                        self._update(0.4 + 0.6 * count / len(prefetched),
+                                     f"Henter billeder til populære varer ({count}/{len(prefetched)})...")
+            finally:
+                get_scheduler().finish_job(job)
+            if item_numbers:
+                self._update(1.0, f"Klar – data indlæst og billeder hentet til {len(item_numbers)} populære varer.",
+                             state="færdig")
+            else:
+                self._update(1.0, "Klar – data indlæst (ingen populære varer angivet).", state="færdig")
+        except Exception as e:
+            logger.exception("Opvarmning fejlede")
+            with self._lock:
+                self._error = str(e)
+            self._update(self._fraction, f"Opvarmning fejlede: {e}", state="fejl")
+        finally:
+            self.report = self.metrics.finish()
+            self.done.set()
+
+@functools.lru_cache(maxsize=None)
+def start_warmup(items_file=WARMUP_ITEMS_FILE, mapping_path=MAPPING_FILE_PATH, stock_path=STOCK_FILE_PATH,
+                 template_path=TEMPLATE_FILE_PATH):
+    """Starter opvarmningen én gang pr. proces og returnerer dens Warmup."""
+    return Warmup(items_file, mapping_path, stock_path, template_path).start()
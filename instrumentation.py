@@ -0,0 +1,160 @@
+"""
+Let instrumentering af PowerPoint-generatoren.
+
+Metrics samler tider pr. trin, tællere og svartider pr. billed-URL og kan
+udskrive en struktureret rapport som JSON. Alt er simple tællere bag en lås,
+så instrumenteringen kan være slået til i drift. tracemalloc er dyrere og
+aktiveres kun med trace_memory=True (eller TRACE_MEMORY=1).
+"""
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # resource findes kun på POSIX-systemer (ikke Windows)
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+TRACE_MEMORY = os.environ.get("TRACE_MEMORY", "") == "1"
+# Sættes mappen, gemmes hver rapport også som en JSON-fil her
+METRICS_REPORT_DIR = os.environ.get("METRICS_REPORT_DIR", "")
+
+# tracemalloc er fælles for hele processen: den startes af den første aktive Metrics
+# og stoppes af den sidste. Toppen tilskrives kun en måling, der har kørt alene.
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_starts = 0
+_tracemalloc_owned = False
+
+def peak_rss_bytes():
+    """Processens højeste RSS i bytes, eller None hvor det ikke kan måles."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss er i kilobytes på Linux og i bytes på macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class Metrics:
+    def __init__(self, trace_memory=TRACE_MEMORY):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.counters = {}
+        self.url_latencies = {}
+        self.trace_memory = trace_memory
+        self._tracing = False
+        if trace_memory:
+            self._start_tracing()
+
+    def _start_tracing(self):
+        global _tracemalloc_users, _tracemalloc_starts, _tracemalloc_owned
+        with _tracemalloc_lock:
+            self._trace_alone = _tracemalloc_users == 0
+            if self._trace_alone:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    _tracemalloc_owned = True
+                tracemalloc.reset_peak()
+            _tracemalloc_users += 1
+            _tracemalloc_starts += 1
+            self._trace_start = _tracemalloc_starts
+            self._tracing = True
+
+    def _stop_tracing(self):
+        global _tracemalloc_users, _tracemalloc_owned
+        with _tracemalloc_lock:
+            if not self._tracing:
+                return
+            self._tracing = False
+            _tracemalloc_users -= 1
+            if _tracemalloc_users == 0 and _tracemalloc_owned:
+                tracemalloc.stop()
+                _tracemalloc_owned = False
+
+    def _traced_peak(self):
+        """Toppen fra tracemalloc, eller None hvis andre målinger har kørt samtidig."""
+        with _tracemalloc_lock:
+            if self._tracing and self._trace_alone and _tracemalloc_starts == self._trace_start:
+                return tracemalloc.get_traced_memory()[1]
+        return None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_timing(name, time.perf_counter() - start)
+
+    def add_timing(self, name, seconds):
+        with self._lock:
+            stage = self.stages.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            stage["count"] += 1
+            stage["total"] += seconds
+            stage["max"] = max(stage["max"], seconds)
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_fetch(self, url, seconds, downloaded_bytes=0):
+        with self._lock:
+            self.url_latencies[url] = max(seconds, self.url_latencies.get(url, 0.0))
+            self.counters["image_bytes_downloaded"] = self.counters.get("image_bytes_downloaded", 0) + downloaded_bytes
+
+    def report(self):
+        with self._lock:
+            stages = {name: dict(stage, mean=stage["total"] / stage["count"]) for name, stage in self.stages.items()}
+            counters = dict(self.counters)
+            latencies = sorted(self.url_latencies.values())
+            slowest = sorted(self.url_latencies.items(), key=lambda item: item[1], reverse=True)[:10]
+        lookups = sum(counters.get(name, 0) for name in ("image_cache_hit", "image_cache_revalidated",
+                                                          "image_cache_miss", "image_cache_stale"))
+        report = {
+            "started_at": self.started_at,
+            "elapsed": time.perf_counter() - self._start,
+            "stages": stages,
+            "counters": counters,
+            "image_cache_hit_rate": ((counters.get("image_cache_hit", 0) + counters.get("image_cache_revalidated", 0))
+                                     / lookups if lookups else None),
+            "image_fetch_latency": {
+                "count": len(latencies),
+                "p50": latencies[len(latencies) // 2] if latencies else None,
+                "p95": latencies[int(len(latencies) * 0.95)] if latencies else None,
+                "max": latencies[-1] if latencies else None,
+                "slowest": slowest,
+            },
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+        # Ved samtidige målinger er tracemallocs top fælles, så kun peak RSS rapporteres
+        traced_peak = self._traced_peak() if self.trace_memory else None
+        if traced_peak is not None:
+            report["tracemalloc_peak_bytes"] = traced_peak
+        return report
+
+    def finish(self):
+        """Afslutter målingen, logger rapporten og gemmer den i METRICS_REPORT_DIR, hvis den er sat."""
+        report = self.report()
+        self._stop_tracing()
+        logger.info("generation metrics %s", json.dumps(report, default=str))
+        if METRICS_REPORT_DIR:
+            try:
+                os.makedirs(METRICS_REPORT_DIR, exist_ok=True)
+                path = os.path.join(METRICS_REPORT_DIR, f"metrics-{int(self.started_at * 1000)}.json")
+                self.write_json(path, report)
+            except OSError as e:
+                logger.warning(f"Kunne ikke gemme ydelsesrapport: {e}")
+        return report
+
+    def write_json(self, path, report=None):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report if report is not None else self.report(), f, indent=2, default=str)